@@ -0,0 +1,170 @@
+"""Autoajuste de primer arranque: mide G19 en este equipo y guarda su perfil.
+
+Uso:
+    python autoajuste.py [--lotes 1 2 4 8] [--repeticiones 10] [--perfil perfil_dispositivo.json]
+
+Mide la latencia de G19 con cada backend disponible (eager, TorchScript G19.ts,
+INT8 G19_int8.ts y, si onnxruntime está instalado, G19.onnx), para cada número
+de hilos intra-op (1 hasta el número de núcleos), de hilos inter-op y de
+tamaño de lote. Como torch solo permite fijar los hilos inter-op una vez por
+proceso, cada valor inter-op se mide en un proceso aparte.
+
+Para la clasificación interactiva (lote de 1) elige la configuración con
+menos hilos cuya latencia queda a menos de ``--margen`` de la mejor, para
+dejar núcleos libres a Tk y a libcamera; el tamaño de lote recomendado es el
+de menor tiempo por imagen con esa configuración. El perfil se guarda en
+``--perfil`` bajo el modelo de placa (``motor_inferencia.device_id``), así un
+mismo archivo puede tener el perfil de cada tipo de placa de la flota.
+``motor_inferencia`` lo aplica al arrancar.
+
+El modelo INT8 solo se mide si ya existe: debe haberse validado antes con
+``cuantizar_googlenet.py --etiquetadas``.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import torch
+import motor_inferencia
+from motor_inferencia import (CHECKPOINT, InferenceEngine, OnnxRuntimeBackend, class_names, device_id,
+                              load_model, load_onnx, load_torchscript, onnx_path, quantized_path,
+                              set_threads, torchscript_path, transform)
+
+
+def available_backends(checkpoint=CHECKPOINT):
+    """``(backend, precision, cargar)`` de cada artefacto de ``checkpoint`` que se puede usar.
+
+    ``cargar(num_threads)`` devuelve el modelo; para PyTorch los hilos se fijan
+    con ``torch.set_num_threads``, ONNX Runtime los recibe al crear la sesión.
+    """
+    backends = [('eager', 'fp32', lambda n: load_model(checkpoint, backend='eager'))]
+    if load_torchscript(torchscript_path(checkpoint), checkpoint) is not None:
+        backends.append(('torchscript', 'fp32',
+                         lambda n: load_torchscript(torchscript_path(checkpoint), checkpoint)))
+    extra_files = {'qengine': ''}
+    if load_torchscript(quantized_path(checkpoint), checkpoint, extra_files) is not None:
+        torch.backends.quantized.engine = extra_files['qengine'].decode()
+        backends.append(('torchscript', 'int8',
+                         lambda n: load_torchscript(quantized_path(checkpoint), checkpoint)))
+    if load_onnx(onnx_path(checkpoint), checkpoint) is not None:
+        backends.append(('onnx', 'fp32', lambda n: OnnxRuntimeBackend(onnx_path(checkpoint), n)))
+    return backends
+
+
+def median_ms(engine, batch_size, repeticiones):
+    """Mediana del tiempo de un forward de ``batch_size`` imágenes, en milisegundos."""
+    batch = torch.randn(batch_size, 3, 224, 224).to(engine.device)
+    batch = batch.contiguous(memory_format=engine.memory_format)
+    times = []
+    with torch.inference_mode():
+        engine.forward(batch)  # warm-up
+        for _ in range(repeticiones):
+            start = time.perf_counter()
+            engine.forward(batch)
+            times.append((time.perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def measure(num_interop_threads, thread_counts, batch_sizes, repeticiones):
+    """Mide todos los backends con ``num_interop_threads`` hilos inter-op (una vez por proceso)."""
+    set_threads(num_interop_threads=num_interop_threads)
+    results = []
+    for backend, precision, cargar in available_backends():
+        engine_device = torch.device('cpu') if precision == 'int8' or backend == 'onnx' else motor_inferencia.device
+        model = None
+        for num_threads in thread_counts:
+            set_threads(num_threads)
+            # La sesión de ONNX Runtime fija sus hilos al crearse; los modelos de torch se reutilizan
+            if model is None or backend == 'onnx':
+                model = cargar(num_threads)
+            engine = InferenceEngine(model, class_names, transform, engine_device)
+            for batch_size in batch_sizes:
+                ms = median_ms(engine, batch_size, repeticiones)
+                results.append({
+                    'backend': backend, 'precision': precision,
+                    'num_threads': num_threads, 'num_interop_threads': num_interop_threads,
+                    'batch_size': batch_size, 'ms_lote': round(ms, 2), 'ms_imagen': round(ms / batch_size, 2),
+                })
+                print(f"  {backend:11s} {precision} intra={num_threads} inter={num_interop_threads} "
+                      f"lote={batch_size}: {ms:.1f} ms ({ms / batch_size:.1f} ms/imagen)", file=sys.stderr)
+    return results
+
+
+def measure_in_subprocess(num_interop_threads, args):
+    """Ejecuta ``measure`` en un proceso nuevo y devuelve sus resultados."""
+    comando = [sys.executable, os.path.abspath(__file__), '--medir-interop', str(num_interop_threads),
+               '--hilos', *map(str, args.hilos), '--lotes', *map(str, args.lotes),
+               '--repeticiones', str(args.repeticiones)]
+    out = subprocess.run(comando, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(out.stdout)
+
+
+def choose_profile(results, margen):
+    """Elige la configuración del perfil a partir de las mediciones."""
+    interactive = [r for r in results if r['batch_size'] == 1]
+    best = min(r['ms_imagen'] for r in interactive)
+    # Entre las que casi empatan con la mejor, la que usa menos hilos
+    elegida = min((r for r in interactive if r['ms_imagen'] <= best * (1 + margen)),
+                  key=lambda r: (r['num_threads'] + r['num_interop_threads'], r['ms_imagen']))
+    same = [r for r in results if all(r[k] == elegida[k] for k in
+                                      ('backend', 'precision', 'num_threads', 'num_interop_threads'))]
+    lote = min(same, key=lambda r: r['ms_imagen'])
+    return {
+        'backend': elegida['backend'],
+        'precision': elegida['precision'],
+        'num_threads': elegida['num_threads'],
+        'num_interop_threads': elegida['num_interop_threads'],
+        'batch_size': lote['batch_size'],
+        'ms_imagen': elegida['ms_imagen'],
+        'ms_imagen_lote': lote['ms_imagen'],
+    }
+
+
+def save_profile(path, profile):
+    """Guarda ``profile`` en ``path`` bajo este equipo, conservando los de otras placas."""
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = json.load(f)
+    profiles[device_id()] = profile
+    with open(path, 'w') as f:
+        json.dump(profiles, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    nucleos = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hilos', type=int, nargs='+', default=list(range(1, nucleos + 1)),
+                        help="hilos intra-op a probar")
+    parser.add_argument('--interop', type=int, nargs='+', default=sorted({1, min(2, nucleos)}),
+                        help="hilos inter-op a probar")
+    parser.add_argument('--lotes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--margen', type=float, default=0.05,
+                        help="latencia extra tolerada para usar menos hilos (0.05 = 5 %%)")
+    parser.add_argument('--perfil', default=motor_inferencia.config['profile_path'])
+    parser.add_argument('--medir-interop', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if 1 not in args.lotes:
+        args.lotes = [1, *args.lotes]
+
+    if args.medir_interop is not None:  # proceso hijo: imprime las mediciones en JSON
+        json.dump(measure(args.medir_interop, args.hilos, args.lotes, args.repeticiones), sys.stdout)
+        return
+
+    print(f"Equipo: {device_id()}")
+    results = []
+    for num_interop_threads in args.interop:
+        results += measure_in_subprocess(num_interop_threads, args)
+    profile = choose_profile(results, args.margen)
+    profile.update(torch=torch.__version__, fecha=time.strftime('%Y-%m-%d %H:%M:%S'), mediciones=results)
+    save_profile(args.perfil, profile)
+    print(f"Perfil guardado en {args.perfil}: backend={profile['backend']} precision={profile['precision']} "
+          f"intra={profile['num_threads']} inter={profile['num_interop_threads']} "
+          f"lote={profile['batch_size']} ({profile['ms_imagen']:.1f} ms/imagen con lote de 1)")
+
+
+if __name__ == '__main__':
+    main()
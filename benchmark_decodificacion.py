@@ -0,0 +1,123 @@
+"""Compara la decodificación JPEG completa con la reducida (``Image.draft``) de ``decodificacion.py``.
+
+Uso:
+    python benchmark_decodificacion.py [--fotos fotos_campo] [--repeticiones 20] [--miniatura 780x400]
+                                       [--con-modelo]
+
+Para el camino del modelo mide decodificación + ``transform`` con la imagen
+completa y con la decodificada a lado corto >= 256; para la vista previa,
+decodificación + ``rotate(-90)`` + ``thumbnail(LANCZOS)`` con la imagen
+completa y con la decodificada al tamaño de la ventana. Imprime la mediana
+de cada uno, el tamaño de la imagen decodificada (memoria de sus píxeles) y
+la diferencia entre los tensores de entrada del modelo. La última fila
+compara la vista previa y la entrada del modelo decodificadas por separado
+con las de un solo ``CaptureFrame``. Con ``--con-modelo``
+también la concordancia de la clase predicha por G19 con ambas entradas.
+Sin fotos usa una captura sintética de 1280x960.
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import time
+from PIL import Image
+import torch
+from decodificacion import CaptureFrame, open_for_model, open_scaled
+from motor_inferencia import iter_image_paths, transform
+
+
+def median_ms(fn, args_list, repeticiones):
+    times = []
+    for args in itertools.islice(itertools.cycle(args_list), repeticiones):
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def decode_full(path):
+    return Image.open(path).convert('RGB')
+
+
+def preview_full(path, size):
+    thumbnail = decode_full(path).rotate(-90, expand=True)
+    thumbnail.thumbnail(size, Image.LANCZOS)
+    return thumbnail
+
+
+def preview_scaled(path, size):
+    thumbnail = open_scaled(path, size[::-1]).rotate(-90, expand=True)
+    thumbnail.thumbnail(size, Image.LANCZOS)
+    return thumbnail
+
+
+def capture_separate(path, size):
+    """Vista previa y entrada del modelo con una decodificación cada una."""
+    return preview_scaled(path, size), open_for_model(path)
+
+
+def capture_frame(path, size):
+    """Vista previa y entrada del modelo desde una sola decodificación (``CaptureFrame``)."""
+    frame = CaptureFrame(path, size)
+    return frame.preview(size), frame.image
+
+
+def run(paths, size, repeticiones, con_modelo):
+    full, scaled = decode_full(paths[0]), open_for_model(paths[0])
+    print(f"Imagen decodificada: completa {full.size[0]}x{full.size[1]} "
+          f"({full.size[0] * full.size[1] * 3 / 2**20:.2f} MiB), para el modelo {scaled.size[0]}x{scaled.size[1]} "
+          f"({scaled.size[0] * scaled.size[1] * 3 / 2**20:.2f} MiB), "
+          f"vista previa {open_scaled(paths[0], size[::-1]).size}")
+
+    items = [(p,) for p in paths]
+    rows = [
+        ('decodificar (modelo)', median_ms(decode_full, items, repeticiones),
+         median_ms(open_for_model, items, repeticiones)),
+        ('decodificar + transform', median_ms(lambda p: transform(decode_full(p)), items, repeticiones),
+         median_ms(lambda p: transform(open_for_model(p)), items, repeticiones)),
+        ('vista previa', median_ms(preview_full, [(p, size) for p in paths], repeticiones),
+         median_ms(preview_scaled, [(p, size) for p in paths], repeticiones)),
+        ('vista previa + modelo (*)', median_ms(capture_separate, [(p, size) for p in paths], repeticiones),
+         median_ms(capture_frame, [(p, size) for p in paths], repeticiones)),
+    ]
+    print(f"{'':26s} {'completa':>10s} {'reducida':>10s} {'ahorro':>8s}  (ms, mediana)")
+    for name, before, after in rows:
+        print(f"{name:26s} {before:10.2f} {after:10.2f} {1 - after / before:8.1%}")
+    print("(*) dos decodificaciones reducidas frente a un solo CaptureFrame")
+
+    full_tensors = torch.stack([transform(decode_full(p)) for p in paths])
+    scaled_tensors = torch.stack([transform(open_for_model(p)) for p in paths])
+    diff = (full_tensors - scaled_tensors).abs()
+    print(f"Entrada del modelo: |Δ| medio {diff.mean():.4f}, máximo {diff.max():.4f} (en unidades normalizadas)")
+    if con_modelo:
+        from motor_inferencia import create_engine
+        engine = create_engine()
+        engine.result_cache = None
+        # engine.transform: con --entrada uint8/float01 el modelo no recibe la entrada normalizada
+        labels_full, _ = engine.classify_batch([engine.transform(decode_full(p)) for p in paths])
+        labels_scaled, _ = engine.classify_batch([engine.transform(open_for_model(p)) for p in paths])
+        agreement = sum(a == b for a, b in zip(labels_full, labels_scaled)) / len(paths)
+        print(f"Concordancia de la clase predicha: {agreement:.1%} ({len(paths)} fotos)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fotos', default='fotos_campo')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--miniatura', default='780x400', help="tamaño máximo de la vista previa (AxB)")
+    parser.add_argument('--con-modelo', action='store_true', help="comparar también la clase predicha por G19")
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.miniatura.split('x'))
+
+    paths = list(itertools.islice(iter_image_paths(args.fotos), args.repeticiones))
+    if paths:
+        return run(paths, size, args.repeticiones, args.con_modelo)
+    print(f"No hay fotos en {args.fotos}; se usa una captura sintética de 1280x960")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'captura.jpg')
+        Image.effect_noise((1280, 960), 64).convert('RGB').save(path, 'JPEG', quality=90)
+        run([path], size, args.repeticiones, args.con_modelo)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Mide por separado cada etapa de tomar_y_clasificar con una cámara simulada.
+
+Uso:
+    python benchmark_etapas.py [--fotos fotos_campo] [--repeticiones 50] [--miniatura 780x400]
+                               [--json base.json] [--comparar base_anterior.json]
+                               [--backend ...] [--precision ...]
+
+Repite el ciclo de una captura de ``CaptureWorker`` con ``FakeCamera``, que
+entrega los bytes de fotos ya tomadas (o de una imagen sintética de
+1280x960), así que corre en cualquier Linux sin libcamera. Etapas: captura
+de los bytes JPEG, decodificación única reducida (``CaptureFrame``),
+preprocesamiento del lote, forward del modelo, ``torch.max``, miniatura
+rotada (``CaptureFrame.preview``) e ``ImageTk.PhotoImage`` (esta última solo
+si hay pantalla).
+
+Imprime una tabla con los percentiles p50/p95/p99 de cada etapa en ms. Con
+``--json`` guarda esos valores como línea base; con ``--comparar`` imprime la
+diferencia del p50 y el p95 de cada etapa contra una línea base anterior.
+"""
+import argparse
+import io
+import json
+import math
+import time
+import torch
+import motor_inferencia
+from decodificacion import CaptureFrame
+from motor_inferencia import create_engine, device_id
+from trabajador_captura import FakeCamera
+
+STAGES = ('captura', 'decodificar', 'preprocesar', 'forward', 'torch.max', 'vista previa', 'photoimage')
+
+
+def percentile(values, p):
+    """Percentil ``p`` por el método del rango más cercano."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def tk_root():
+    """Raíz de Tk oculta para crear PhotoImage, o ``None`` si no hay pantalla."""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return root
+    except Exception as e:  # sin DISPLAY o sin tkinter
+        print(f"Sin pantalla, no se mide ImageTk.PhotoImage: {e}")
+        return None
+
+
+def run_once(engine, camera, preview_size, root):
+    """Ejecuta un ciclo de captura y clasificación como ``CaptureWorker`` y devuelve los ms de cada etapa."""
+    times = {}
+
+    def timed(stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        times[stage] = (time.perf_counter() - start) * 1000
+        return result
+
+    data = timed('captura', camera)
+    frame = timed('decodificar', CaptureFrame, io.BytesIO(data), preview_size)
+    batch = timed('preprocesar', engine.preprocess, [frame.image])
+    with torch.inference_mode():
+        logits = timed('forward', engine.forward, batch)
+        timed('torch.max', torch.max, logits, 1)
+    thumbnail = timed('vista previa', frame.preview, preview_size)
+    if root is not None:
+        from PIL import ImageTk
+        timed('photoimage', ImageTk.PhotoImage, thumbnail)
+    return times
+
+
+def summarize(samples):
+    """``{etapa: {p50, p95, p99, media}}`` en ms, más el total por captura."""
+    samples = dict(samples)
+    runs = len(next(iter(samples.values())))
+    samples['total'] = [sum(values[i] for values in samples.values()) for i in range(runs)]
+    return {stage: {'p50': round(percentile(v, 50), 3), 'p95': round(percentile(v, 95), 3),
+                    'p99': round(percentile(v, 99), 3), 'media': round(sum(v) / len(v), 3)}
+            for stage, v in samples.items()}
+
+
+def print_table(summary):
+    print(f"{'etapa':13s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'media':>9s}  (ms)")
+    for stage, s in summary.items():
+        print(f"{stage:13s} {s['p50']:9.2f} {s['p95']:9.2f} {s['p99']:9.2f} {s['media']:9.2f}")
+
+
+def print_comparison(summary, baseline):
+    print(f"\nComparación con la línea base ({baseline.get('fecha', '?')}, {baseline.get('equipo', '?')}):")
+    print(f"{'etapa':13s} {'p50 antes':>10s} {'p50 ahora':>10s} {'Δ p50':>8s} {'Δ p95':>8s}")
+    for stage, s in summary.items():
+        before = baseline['etapas'].get(stage)
+        if before is None:
+            continue
+        d50 = (s['p50'] / before['p50'] - 1) if before['p50'] else 0.0
+        d95 = (s['p95'] / before['p95'] - 1) if before['p95'] else 0.0
+        print(f"{stage:13s} {before['p50']:10.2f} {s['p50']:10.2f} {d50:+8.1%} {d95:+8.1%}")
+
+
+def main():
+    motor_inferencia.configure_from_args()  # --backend, --precision, --hilos, ...
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fotos', default='fotos_campo', help="fotos que repite la cámara simulada")
+    parser.add_argument('--repeticiones', type=int, default=50)
+    parser.add_argument('--calentamiento', type=int, default=3)
+    parser.add_argument('--miniatura', default='780x400', help="tamaño máximo de la vista previa (AxB)")
+    parser.add_argument('--json', default=None, help="guardar la línea base en este archivo")
+    parser.add_argument('--comparar', default=None, help="línea base anterior para comparar")
+    args, _ = parser.parse_known_args()
+    preview_size = tuple(int(v) for v in args.miniatura.split('x'))
+
+    engine = create_engine()
+    engine.result_cache = None  # se mide el forward real en cada repetición
+    camera = FakeCamera(args.fotos)
+    root = tk_root()
+    samples = {stage: [] for stage in STAGES if stage != 'photoimage' or root is not None}
+    for i in range(args.calentamiento + args.repeticiones):
+        times = run_once(engine, camera.read, preview_size, root)
+        if i >= args.calentamiento:
+            for stage, ms in times.items():
+                samples[stage].append(ms)
+    if root is not None:
+        root.destroy()
+
+    summary = summarize(samples)
+    print(f"{engine.name} ({type(engine.model).__name__}, {motor_inferencia.config['precision']}) en "
+          f"{device_id()}, {args.repeticiones} repeticiones")
+    if camera.skipped:
+        print(f"{len(camera.skipped)} fotos de {args.fotos} omitidas por no poder leerse")
+    print_table(summary)
+    if args.comparar:
+        with open(args.comparar) as f:
+            print_comparison(summary, json.load(f))
+    if args.json:
+        baseline = {
+            'equipo': device_id(),
+            'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'torch': torch.__version__,
+            'modelo': engine.name,
+            'backend': type(engine.model).__name__,
+            'precision': motor_inferencia.config['precision'],
+            'repeticiones': args.repeticiones,
+            'miniatura': list(preview_size),
+            'etapas': summary,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"Línea base guardada en {args.json}")
+
+
+if __name__ == '__main__':
+    main()
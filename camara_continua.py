@@ -0,0 +1,231 @@
+"""Cámara continua: un solo proceso libcamera-vid que mantiene el sensor encendido.
+
+Uso (medir la latencia de captura):
+    python camara_continua.py [--camara continua|por-captura|simulada] [--fotos-simuladas carpeta]
+                              [--capturas 10] [--fps 10]
+
+``capturar_jpeg_bytes`` lanza libcamera-jpeg en cada captura y paga cada vez el
+arranque del proceso, la inicialización del sensor y los 200 ms de ``-t 200``
+para el ajuste de exposición. ``LibcameraVidCamera`` lanza una sola vez
+``libcamera-vid --codec mjpeg -o -``, separa los JPEG del flujo en un hilo y
+conserva solo el último; ``read()`` devuelve el siguiente fotograma completo,
+así que la espera por captura es como mucho un intervalo entre fotogramas. Si
+el proceso termina, se vuelve a lanzar.
+
+``ReplayCamera`` tiene la misma interfaz pero reproduce fotos de una carpeta
+(o una imagen sintética) al ritmo indicado, para probar sin cámara.
+``camera_from_args`` elige la cámara según ``--camara``; las interfaces pasan
+su ``read`` como ``capture`` de ``CaptureWorker``.
+"""
+import argparse
+import atexit
+import subprocess
+import threading
+import time
+from trabajador_captura import FakeCamera, capturar_jpeg_bytes
+
+CAMERAS = ('continua', 'por-captura', 'simulada')
+SOI, EOI = b'\xff\xd8', b'\xff\xd9'
+
+
+def split_jpeg_stream(stream, chunk_size=1 << 16):
+    """Separa en JPEG completos (de SOI a EOI) un flujo MJPEG como el de ``libcamera-vid -o -``."""
+    buffer = bytearray()
+    scan = 0  # desde dónde buscar EOI, para no volver a recorrer lo ya revisado
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        while True:
+            start = buffer.find(SOI)
+            if start < 0:
+                del buffer[:-1]  # el último byte puede ser la mitad de un SOI
+                scan = 0
+                break
+            if start > 0:
+                del buffer[:start]
+                scan = max(0, scan - start)
+            end = buffer.find(EOI, max(2, scan))
+            if end < 0:
+                scan = len(buffer) - 1
+                break
+            yield bytes(buffer[:end + 2])
+            del buffer[:end + 2]
+            scan = 0
+
+
+class StreamingCamera:
+    """Base de las cámaras continuas: un hilo consume ``_frames()`` y guarda el último fotograma.
+
+    Los primeros ``warmup_frames`` de cada arranque se descartan mientras se
+    ajustan la exposición y el balance de blancos. Si ``_frames()`` falla o
+    termina, se reintenta tras ``restart_delay`` segundos; una ``read`` en
+    curso recibe ese error solo si tampoco el reintento entrega un fotograma.
+    """
+
+    def __init__(self, warmup_frames=0, restart_delay=1.0):
+        self.warmup_frames = warmup_frames
+        self.restart_delay = restart_delay
+        self.frames = 0
+        self.failures = 0
+        self._frame = None
+        self._error = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _frames(self):
+        raise NotImplementedError
+
+    def _run(self):
+        while not self._closed:
+            try:
+                for i, frame in enumerate(self._frames()):
+                    if self._closed:
+                        return
+                    if i < self.warmup_frames:
+                        continue
+                    with self._cond:
+                        self._frame = frame
+                        self.frames += 1
+                        self._cond.notify_all()
+                raise RuntimeError("el flujo de la cámara terminó")
+            except Exception as e:
+                if self._closed:
+                    return
+                with self._cond:
+                    self._error = e
+                    self.failures += 1
+                    self._cond.notify_all()
+                time.sleep(self.restart_delay)
+
+    def latest(self):
+        """El último fotograma recibido (bytes JPEG) sin esperar, o ``None``."""
+        with self._cond:
+            return self._frame
+
+    def read(self, timeout=5.0):
+        """Espera el siguiente fotograma completo y devuelve sus bytes JPEG.
+
+        Se usa como ``capture`` de ``CaptureWorker``. Lanza el error de la
+        cámara si falló, o ``TimeoutError`` si no llega ningún fotograma.
+        """
+        with self._cond:
+            target = self.frames + 1
+            # Un error anterior a la llamada no cuenta: puede que la cámara ya se esté reiniciando
+            failures = self.failures
+            self._cond.wait_for(lambda: self.frames >= target or self.failures > failures or self._closed,
+                                timeout)
+            if self.frames >= target:
+                return self._frame
+            if self.failures > failures:
+                raise self._error
+            if self._closed:
+                raise RuntimeError("La cámara está cerrada")
+            raise TimeoutError(f"La cámara no entregó ningún fotograma en {timeout:.0f} s")
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class LibcameraVidCamera(StreamingCamera):
+    """Cámara continua sobre ``libcamera-vid`` en MJPEG.
+
+    ``fps`` fija el retardo máximo de ``read`` (1/fps) y el costo de CPU de
+    codificar el flujo; ``quality`` es la calidad JPEG de cada fotograma.
+    """
+
+    def __init__(self, width=1280, height=960, fps=10, quality=90, warmup_frames=3):
+        self.command = ['libcamera-vid', '-n', '-t', '0', '--codec', 'mjpeg', '--quality', str(quality),
+                        '--width', str(width), '--height', str(height), '--framerate', str(fps), '-o', '-']
+        self._process = None
+        super().__init__(warmup_frames)
+
+    def _frames(self):
+        self._process = subprocess.Popen(self.command, stdout=subprocess.PIPE, bufsize=0)
+        try:
+            yield from split_jpeg_stream(self._process.stdout)
+        finally:
+            self._stop_process()
+        raise RuntimeError(f"libcamera-vid terminó (código {self._process.returncode})")
+
+    def _stop_process(self):
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def close(self):
+        super().close()
+        self._stop_process()
+
+
+class ReplayCamera(StreamingCamera):
+    """Cámara continua simulada: reproduce en ciclo las fotos de ``folder`` a ``fps`` fotogramas por segundo."""
+
+    def __init__(self, folder=None, fps=10, width=1280, height=960):
+        self.source = FakeCamera(folder)
+        self.fps = fps
+        self.size = (width, height)
+        super().__init__()
+
+    def _frames(self):
+        while True:
+            yield self.source.read(*self.size)
+            time.sleep(1 / self.fps)
+
+
+def open_camera(kind='continua', folder=None, fps=10):
+    """Función de captura (sin argumentos, devuelve bytes JPEG) para ``CaptureWorker``."""
+    if kind == 'continua':
+        return LibcameraVidCamera(fps=fps).read
+    if kind == 'simulada':
+        return ReplayCamera(folder, fps).read
+    return capturar_jpeg_bytes
+
+
+def camera_from_args(argv=None):
+    """Lee ``--camara``, ``--fotos-simuladas`` y ``--fps`` (ignora el resto) y abre esa cámara."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--camara', choices=CAMERAS, default='continua')
+    parser.add_argument('--fotos-simuladas', default=None)
+    parser.add_argument('--fps', type=int, default=10)
+    args, _ = parser.parse_known_args(argv)
+    return open_camera(args.camara, args.fotos_simuladas, args.fps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--camara', choices=CAMERAS, default='continua')
+    parser.add_argument('--fotos-simuladas', default=None, help="carpeta de fotos para --camara simulada")
+    parser.add_argument('--capturas', type=int, default=10)
+    parser.add_argument('--fps', type=int, default=10)
+    parser.add_argument('--pausa', type=float, default=0.5, help="segundos entre capturas, como entre pulsaciones")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    capture = open_camera(args.camara, args.fotos_simuladas, args.fps)
+    capture()  # la primera incluye el arranque de la cámara
+    print(f"Primera captura: {(time.perf_counter() - start) * 1000:.0f} ms")
+    times = []
+    for _ in range(args.capturas):
+        time.sleep(args.pausa)
+        start = time.perf_counter()
+        data = capture()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    print(f"{args.camara}: {args.capturas} capturas, mediana {times[len(times) // 2]:.0f} ms, "
+          f"máximo {times[-1]:.0f} ms, último JPEG de {len(data) / 1024:.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,105 +1,23 @@
 import tkinter as tk
 import tkinter.font as tkfont
-from PIL import Image, ImageTk
-import os
-from datetime import datetime
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
-import subprocess
+from PIL import ImageTk
+from camara_continua import camera_from_args
+from trabajador_captura import CaptureWorker, retention_from_args
+from recomendaciones import class_recomendaciones
 
 # --- Configuración modelo ---
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-class_names = ['R5', 'R6', 'R7', 'R8', 'R9', 'V1', 'V2', 'V3', 'V4']
-
-# Aquí la nueva estructura con descripción y recomendaciones
-class_recomendaciones = {
-    'V1': {
-        "descripcion": "Emergencia del primer par de hojas unifoliadas completamente abiertas.",
-        "recomendaciones": (
-            "Riego: Mantener humedad uniforme en el perfil de suelo para favorecer desarrollo radicular. "
-            "Control de malezas: Paso temprano de escarda o herbicida residual selectivo. "
-            "Salud de suelo: Revisar pH y enmendar con cal si sea necesario."
-        )
-    },
-    'V2': {
-        "descripcion": "Aparición del primer par de hojas trifoliadas completamente desarrolladas.",
-        "recomendaciones": (
-            "Fertilización: Primera dosis de nitrógeno (si no hay buena inoculación bacteriana), monitorear fósforo y potasio. "
-            "Monitoreo de plagas: Inspeccionar áfidos y trips; usar trampas cromáticas. "
-            "Control de malezas tardías: Segundo pase de escarda o herbicida residual."
-        )
-    },
-    'V3': {
-        "descripcion": "Desarrollo del segundo par de hojas trifoliadas.",
-        "recomendaciones": (
-            "Micronutrientes: Aplicación foliar ligera de zinc y boro si hay clorosis o necrosis. "
-            "Salud foliar: Revisar síntomas de roya y manchas; fungicida preventivo si aparecen. "
-            "Riego: Ajustar frecuencia según humedad del suelo para evitar estrés hídrico."
-        )
-    },
-    'V4': {
-        "descripcion": "Desarrollo del tercer par de hojas trifoliadas; la planta continúa acumulando biomasa.",
-        "recomendaciones": (
-            "Dosel y densidad: Evaluar cobertura del suelo y considerar ajustes de densidad para el próximo ciclo. "
-            "Control biológico: Fomentar insectos benéficos con bandas florales o refugios. "
-            "Nutrición: Refuerzo de potasio para mejorar resistencia al estrés."
-        )
-    },
-    'R5': {
-        "descripcion": "Inicio de la floración; se observan las primeras flores abiertas.",
-        "recomendaciones": (
-            "Riego crítico: Humedad constante durante floración para evitar caída de flores. "
-            "Fungicidas: Aplicar mezcla de contacto + sistémico al inicio de floración. "
-            "Insecticidas: Monitorear y controlar chinches de soya y mosquita blanca."
-        )
-    },
-    'R6': {
-        "descripcion": "Floración plena; la mayoría de las plantas tienen flores.",
-        "recomendaciones": (
-            "Monitoreo climático: Refuerzo de fungicida en periodos lluviosos y riego de auxilio en calor extremo. "
-            "Foliar: Aporte de calcio y magnesio para mejorar cuajado de vainas. "
-            "Control integrado: Mantener trampas y seguimiento de plagas."
-        )
-    },
-    'R7': {
-        "descripcion": "Formación de vainas; las primeras vainas jóvenes son visibles.",
-        "recomendaciones": (
-            "Fertilización de fondo: Si el análisis de tejido lo indica, aplicar fertilizante de liberación lenta. "
-            "Riego de socorro: Mantener 60–70 % de capacidad de campo para proteger número de semillas. "
-            "Inspección de frutos: Vigilar daños por trips y chinches."
-        )
-    },
-    'R8': {
-        "descripcion": "Llenado de vainas; las semillas dentro de las vainas comienzan a desarrollarse.",
-        "recomendaciones": (
-            "Riego óptimo: Evitar déficit hídrico, etapa crítica para rendimiento. "
-            "Enfermedades de vainas: Revisar antracnosis y aplicar fungicida si hay manchas. "
-            "Nutrición final: Aporte foliar de potasio para mejorar transporte de fotosintatos."
-        )
-    },
-    'R9': {
-        "descripcion": "Madurez fisiológica; las semillas alcanzan su tamaño y peso máximo, y las vainas comienzan a secarse.",
-        "recomendaciones": (
-            "Reducción de riego: Suspender cuando las vainas empiecen a secar para facilitar madurez. "
-            "Cosecha: Vigilar humedad de grano (18–20 %) para programar fecha óptima. "
-            "Prevención de pérdidas: Controlar roedores y aves durante madurez."
-        )
-    }
-}
-
-model = models.googlenet(weights=None, aux_logits=False)
-model.fc = nn.Linear(model.fc.in_features, len(class_names))
-model.load_state_dict(torch.load('G19.pth', map_location=device))
-model.to(device)
-model.eval()
-
-transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+
+MODELO_INICIAL = 'G19'
+switcher = None  # Modelo activo (registro_modelos.ModelSwitcher), creado por el trabajador
+
+def cargar_clasificador():
+    """``load_classifier`` del trabajador: crea el ModelSwitcher con el modelo inicial (ver trabajador_captura)."""
+    global switcher
+    import motor_inferencia
+    from registro_modelos import ModelSwitcher
+    motor_inferencia.configure_from_args()  # ej: --precision int8
+    switcher = ModelSwitcher(MODELO_INICIAL)
+    return switcher.classify_image
 
 # --- Interfaz Tkinter ---
 BASE_FONT_SIZE   = 12
@@ -196,7 +114,8 @@ capture_btn = tk.Button(
     button_frame,
     text='Tomar Foto',
     font=tkfont.Font(family=BUTTON_FONT_FAM, size=BUTTON_FONT_SIZE, weight='bold'),
-    command=lambda: tomar_y_clasificar()
+    command=lambda: tomar_y_clasificar(),
+    state=tk.DISABLED  # Se habilita cuando el modelo está listo
 )
 capture_btn.grid(row=0, column=0, sticky="ew", pady=(0,4))
 
@@ -209,79 +128,107 @@ clear_btn = tk.Button(
 )
 clear_btn.grid(row=1, column=0, sticky="ew")
 
+model_var = tk.StringVar(value=MODELO_INICIAL)
+model_menu = tk.OptionMenu(button_frame, model_var, MODELO_INICIAL)
+model_menu.config(font=tkfont.Font(family=BUTTON_FONT_FAM, size=BUTTON_FONT_SIZE), state=tk.DISABLED)
+model_menu.grid(row=2, column=0, sticky="ew", pady=(4,0))
+
 last_photo_path = None
-current_pil_image = None
+current_frame = None
 resize_job = None
+# En campo se conservan por defecto todas las fotos (--conservar never lo evita); se escriben en segundo plano
+worker = CaptureWorker(cargar_clasificador, save_dir='fotos_campo', capture=camera_from_args(),
+                       retention=retention_from_args('always'))
 
-def classify_image(path_or_pil_image):
-    if isinstance(path_or_pil_image, str):
-        img = Image.open(path_or_pil_image).convert('RGB')
-    else:
-        img = path_or_pil_image.convert('RGB')
-    tensor = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        out = model(tensor)
-        _, pred = torch.max(out, 1)
-    return class_names[pred.item()]
-
-def display_image(pil_img_to_display):
-    global current_pil_image
-    pil_img_to_display = pil_img_to_display.rotate(-90, expand=True)
-    current_pil_image = pil_img_to_display
+def preview_size():
     image_label.update_idletasks()
     max_w = image_label.winfo_width() - 10
     max_h = image_label.winfo_height() - 10
-    img_copy = current_pil_image.copy()
-    img_copy.thumbnail((max(max_w,10), max(max_h,10)), Image.LANCZOS)
-    tk_img = ImageTk.PhotoImage(img_copy)
+    return (max(max_w,10), max(max_h,10))
+
+def display_image(frame, thumbnail):
+    global current_frame
+    current_frame = frame
+    tk_img = ImageTk.PhotoImage(thumbnail)
     image_label.config(image=tk_img, text='')
     image_label.image = tk_img
 
 def tomar_y_clasificar():
-    global last_photo_path
+    # La captura y la clasificación corren en el trabajador; aquí solo se encola
     stage_label.config(text='')
     desc_label.config(text='Capturando imagen...')
     reco_label.config(text='')
-    root.update_idletasks()
-
-    save_dir = 'fotos_campo'
-    os.makedirs(save_dir, exist_ok=True)
-    ruta = os.path.join(save_dir, f'captura_{datetime.now():%Y%m%d_%H%M%S}.jpg')
-    try:
-        subprocess.run(
-            ['libcamera-jpeg','-n','-o',ruta,'-t','200','--width','1280','--height','960'],
-            check=True
-        )
-    except Exception as e:
-        desc_label.config(text=f'Error captura: {e}')
-        return
+    worker.submit(preview_size())
 
-    try:
-        pil_image = Image.open(ruta)
-        display_image(pil_image)
-    except Exception as e:
-        desc_label.config(text=f'Error mostrar imagen: {e}')
+def cambiar_modelo(nombre):
+    """Pide el cambio de modelo; el actual sigue clasificando hasta que el nuevo esté listo."""
+    model_var.set(nombre)
+    if nombre == switcher.name:
         return
-
-    desc_label.config(text='Clasificando...')
-    root.update_idletasks()
-    try:
-        cls = classify_image(pil_image)
+    model_menu.config(state=tk.DISABLED)
+    desc_label.config(text=f'Cargando modelo {nombre}...')
+    # El aviso llega desde el hilo de carga; se encola junto a los eventos del trabajador
+    switcher.swap(nombre, on_done=lambda n, e: worker.events.put(('modelo', (n, e))))
+
+def llenar_menu_modelos():
+    from registro_modelos import REGISTRY
+    menu = model_menu['menu']
+    menu.delete(0, 'end')
+    for nombre, spec in REGISTRY.items():
+        # Los modelos sin checkpoint en disco aparecen deshabilitados
+        menu.add_command(label=nombre, command=lambda n=nombre: cambiar_modelo(n),
+                         state=tk.NORMAL if spec.available() else tk.DISABLED)
+    model_menu.config(state=tk.NORMAL)
+
+def on_worker_event(tipo, dato):
+    global last_photo_path
+    if tipo == 'estado':
+        desc_label.config(text=dato)
+    elif tipo == 'listo':
+        desc_label.config(text='Esperando acción...')
+        capture_btn.config(state=tk.NORMAL)
+        llenar_menu_modelos()
+    elif tipo == 'modelo':
+        nombre, e = dato
+        if e is None:
+            desc_label.config(text=f'Modelo activo: {nombre}')
+        else:
+            desc_label.config(text=f'Error al cargar el modelo {nombre}: {e}')
+        model_var.set(switcher.name)
+        model_menu.config(state=tk.NORMAL)
+    elif tipo == 'imagen':
+        ruta, frame, thumbnail = dato
+        display_image(frame, thumbnail)
+    elif tipo == 'resultado':
+        ruta, cls = dato
         datos = class_recomendaciones.get(cls, {})
         stage_label.config(text=f"Etapa: {cls}")
         desc_label.config(text=datos.get("descripcion","Sin descripción."))
         reco_label.config(text=datos.get("recomendaciones","Sin recomendaciones."))
-    except Exception as e:
-        desc_label.config(text=f'Error clasificar: {e}')
-
-    capture_btn.config(state=tk.DISABLED)
-    clear_btn.config(state=tk.NORMAL)
-    last_photo_path = ruta
+        if not worker.pending():
+            capture_btn.config(state=tk.DISABLED)
+        clear_btn.config(state=tk.NORMAL)
+        last_photo_path = ruta
+        stats = getattr(switcher.engine, 'stats', None)
+        if stats is not None:  # modo cascada: cuántas capturas necesitaron G19
+            print(f"Cascada {switcher.name}: {stats.summary()}")
+    elif tipo == 'error':
+        etapa, e = dato
+        if etapa == 'modelo':
+            desc_label.config(text=f'Error al cargar el modelo: {e}')
+        elif etapa == 'captura':
+            desc_label.config(text=f'Error captura: {e}')
+        elif etapa == 'mostrar':
+            desc_label.config(text=f'Error mostrar imagen: {e}')
+        else:
+            desc_label.config(text=f'Error clasificar: {e}')
+            capture_btn.config(state=tk.DISABLED)
+            clear_btn.config(state=tk.NORMAL)
 
 def limpiar():
-    global last_photo_path, current_pil_image
+    global last_photo_path, current_frame
     last_photo_path = None
-    current_pil_image = None
+    current_frame = None
     image_label.config(image=None, text='Imagen', fg='gray',
                        font=tkfont.Font(family=IMAGE_FONT_FAM, size=BASE_FONT_SIZE+4, weight='bold'))
     image_label.image = None
@@ -299,19 +246,17 @@ def update_status_wraplength(event=None):
 
 def on_image_label_configure(event):
     global resize_job
-    if current_pil_image:
+    if current_frame:
         if resize_job:
             root.after_cancel(resize_job)
         resize_job = root.after(250, actual_image_resize_on_configure)
 
 def actual_image_resize_on_configure():
-    if not current_pil_image or not image_label.winfo_exists():
+    if not current_frame or not image_label.winfo_exists():
         return
     max_w = image_label.winfo_width() - 10
     max_h = image_label.winfo_height() - 10
-    img_copy = current_pil_image.copy()
-    img_copy.thumbnail((max(max_w,10), max(max_h,10)), Image.LANCZOS)
-    tk_img = ImageTk.PhotoImage(img_copy)
+    tk_img = ImageTk.PhotoImage(current_frame.preview((max(max_w,10), max(max_h,10))))
     image_label.config(image=tk_img)
     image_label.image = tk_img
 
@@ -320,5 +265,6 @@ image_label.bind("<Configure>", on_image_label_configure)
 
 root.update_idletasks()
 update_status_wraplength()
+worker.poll(root, on_worker_event)
 
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,290 @@
+"""Almacén en disco de las características del backbone, para evaluar o entrenar cabezas sin repetir el forward.
+
+Uso:
+    python caracteristicas.py extraer fotos_campo [--modelo G19]
+    python caracteristicas.py evaluar carpeta [--modelo G19] [--cabeza cabeza.pth] [--etiquetadas]
+    python caracteristicas.py entrenar carpeta_etiquetada --salida cabeza.pth [--modelo G19] [--epocas 200]
+
+Todas las redes del proyecto terminan en ``model.fc``, una capa lineal sobre
+el vector de 1024 (GoogLeNet) o 512 (ResNet34) características del pooling
+global. ``extraer`` calcula ese vector una sola vez por imagen y lo guarda en
+``FeatureStore``, indexado por el SHA-256 del archivo (la misma foto en dos
+carpetas se calcula una vez y una foto renombrada no se recalcula). Después,
+evaluar una cabeza sobre miles de fotos archivadas es una multiplicación de
+matrices, y ``entrenar`` ajusta una cabeza nueva directamente sobre las
+características guardadas.
+
+Cada almacén corresponde a un checkpoint y a un preprocesamiento: guarda el
+hash del checkpoint, la transformación y si se decodifica a escala
+(``scaled_decode``), y se niega a mezclar características calculadas de otra
+forma. Las imágenes que no se pueden decodificar se informan, se omiten y su
+hash queda anotado en el almacén para no reintentarlas. El backbone solo se
+carga si falta alguna característica de una imagen no anotada como ilegible.
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import numpy as np
+import torch
+import torch.nn as nn
+from motor_inferencia import (config, iter_image_paths, iter_labeled_images, load_model, load_state_dict,
+                              resizes_to_model_side, sha256_file, to_rgb)
+
+
+class FeatureStore:
+    """Vectores de características por hash de imagen en ``directorio``.
+
+    ``claves.txt`` tiene un hash por línea y ``datos.f16`` las filas
+    correspondientes en float16 (2 KiB por imagen con 1024 características),
+    que se leen mapeadas en memoria. Solo se agregan filas al final; si una
+    escritura se interrumpe, al abrir se descartan las filas sin clave.
+    ``fallidas.txt`` tiene los hashes de las imágenes que no se pudieron leer.
+    """
+
+    def __init__(self, directorio, checkpoint_sha256, dim, preprocess=None):
+        self.directorio = directorio
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._datos = os.path.join(directorio, 'datos.f16')
+        self._claves = os.path.join(directorio, 'claves.txt')
+        self._fallidas = os.path.join(directorio, 'fallidas.txt')
+        meta_path = os.path.join(directorio, 'meta.json')
+        meta = {'checkpoint_sha256': checkpoint_sha256, 'dim': dim, 'dtype': 'float16', 'preprocess': preprocess}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored = json.load(f)
+            if stored != meta:
+                raise ValueError(f"{directorio} tiene características de otro backbone o preprocesamiento: {stored}")
+        else:
+            os.makedirs(directorio, exist_ok=True)
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+
+        keys = []
+        if os.path.exists(self._claves):
+            with open(self._claves) as f:
+                keys = f.read().split()
+        rows = os.path.getsize(self._datos) // (2 * dim) if os.path.exists(self._datos) else 0
+        if rows != len(keys):  # escritura interrumpida: se conservan las filas completas con clave
+            keys = keys[:rows]
+            with open(self._datos, 'r+b') as f:
+                f.truncate(len(keys) * 2 * dim)
+            with open(self._claves, 'w') as f:
+                f.writelines(k + '\n' for k in keys)
+        self._index = {k: i for i, k in enumerate(keys)}
+        self._memmap = None
+        self._failed = set()
+        if os.path.exists(self._fallidas):
+            with open(self._fallidas) as f:
+                self._failed = set(f.read().split())
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def is_failed(self, key):
+        """``True`` si la imagen con hash ``key`` ya falló al decodificarse."""
+        return key in self._failed
+
+    def mark_failed(self, keys):
+        """Anota los hashes ``keys`` como imágenes ilegibles."""
+        with self._lock:
+            nuevas = [k for k in dict.fromkeys(keys) if k not in self._failed]
+            if not nuevas:
+                return
+            with open(self._fallidas, 'a') as f:
+                f.writelines(k + '\n' for k in nuevas)
+            self._failed.update(nuevas)
+
+    def add(self, keys, features):
+        """Agrega las filas de ``features`` (``(N, dim)``) con sus ``keys``; ignora las que ya existen."""
+        with self._lock:
+            nuevas = [(k, f) for k, f in zip(keys, features) if k not in self._index]
+            if not nuevas:
+                return
+            rows = torch.stack([f for _, f in nuevas]).float().cpu().numpy().astype(np.float16)
+            # Primero los datos y luego las claves: una clave nunca apunta a una fila incompleta
+            with open(self._datos, 'ab') as f:
+                f.write(rows.tobytes())
+            with open(self._claves, 'a') as f:
+                f.writelines(k + '\n' for k, _ in nuevas)
+            for k, _ in nuevas:
+                self._index[k] = len(self._index)
+            self._memmap = None
+
+    def get(self, keys):
+        """Tensor float32 ``(N, dim)`` con las características de ``keys``."""
+        with self._lock:
+            if self._memmap is None:
+                self._memmap = np.memmap(self._datos, dtype=np.float16, mode='r').reshape(-1, self.dim)
+            rows = [self._index[k] for k in keys]
+            return torch.from_numpy(self._memmap[rows].astype(np.float32))
+
+
+def load_backbone(spec):
+    """Backbone de ``spec`` con ``fc`` reemplazada por Identity."""
+    model = load_model(spec.checkpoint, backend='eager', build=spec.build)
+    model.fc = nn.Identity()
+    return model
+
+
+def head_features(spec):
+    """Número de características de entrada de ``model.fc`` en ``spec``, o ``None`` si no tiene ``fc``."""
+    if spec.build is None:
+        return None
+    with torch.device('meta'):
+        fc = getattr(spec.build(), 'fc', None)
+    return fc.in_features if isinstance(fc, nn.Linear) else None
+
+
+def scaled_decode(spec):
+    """Si las imágenes de ``spec`` se decodifican a escala (solo si su transformación empieza con Resize(256))."""
+    return config['scaled_decode'] and resizes_to_model_side(spec.transform)
+
+
+def open_store(spec, directorio=None):
+    # Con otro recorte o con otra decodificación las características de la misma foto cambian
+    preprocess = {'transform': repr(spec.transform), 'scaled_decode': scaled_decode(spec)}
+    directorio = directorio or os.path.join('caracteristicas', spec.name)
+    return FeatureStore(directorio, sha256_file(spec.checkpoint), head_features(spec), preprocess)
+
+
+def missing(keys, store):
+    """Hashes de ``keys`` sin características en ``store`` y no anotados como ilegibles."""
+    return [k for k in keys if k not in store and not store.is_failed(k)]
+
+
+def extract(paths, keys, store, backbone, spec, batch_size=None):
+    """Calcula y guarda las características de las imágenes de ``paths`` (con hashes ``keys``) que falten en ``store``.
+
+    Se preprocesan con ``spec.transform``. Las imágenes que no se pueden
+    decodificar se informan, se omiten y se anotan en ``store``.
+    """
+    batch_size = batch_size or config['batch_size']
+    scaled = scaled_decode(spec)
+    pending = {}
+    for path, key in zip(paths, keys):
+        if key not in store and not store.is_failed(key):
+            pending.setdefault(key, path)
+    device = next(backbone.parameters()).device
+    pending = iter(pending.items())
+    while True:
+        chunk = list(itertools.islice(pending, batch_size))
+        if not chunk:
+            break
+        done, tensors, failed = [], [], []
+        for key, path in chunk:
+            try:
+                tensors.append(spec.transform(to_rgb(path, scaled)))
+            except (OSError, ValueError) as e:  # archivo truncado o que no es una imagen
+                print(f"No se pudo leer {path}: {e}")
+                failed.append(key)
+                continue
+            done.append(key)
+        store.mark_failed(failed)
+        if not tensors:
+            continue
+        batch = torch.stack(tensors).to(device)
+        with torch.inference_mode():
+            features = backbone(batch.contiguous(memory_format=torch.channels_last))
+        store.add(done, features)
+
+
+def load_head(path, in_features):
+    """Cabeza lineal guardada por ``entrenar`` (o la ``fc`` de un checkpoint) sobre ``in_features`` características."""
+    state = load_state_dict(path)
+    state = {k.removeprefix('fc.'): v for k, v in state.items() if k in ('weight', 'bias', 'fc.weight', 'fc.bias')}
+    head = nn.Linear(in_features, state['weight'].shape[0])
+    head.load_state_dict(state)
+    return head.eval()
+
+
+def train_head(features, targets, num_classes, epochs=200, weight_decay=1e-4):
+    """Ajusta una capa lineal sobre ``features`` con L-BFGS sobre el lote completo."""
+    head = nn.Linear(features.shape[1], num_classes)
+    optimizer = torch.optim.LBFGS(head.parameters(), max_iter=epochs, line_search_fn='strong_wolfe')
+    loss_fn = nn.CrossEntropyLoss()
+
+    def closure():
+        optimizer.zero_grad()
+        loss = loss_fn(head(features), targets) + weight_decay * head.weight.pow(2).sum()
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return head.eval()
+
+
+def main():
+    from registro_modelos import REGISTRY
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('accion', choices=('extraer', 'evaluar', 'entrenar'))
+    parser.add_argument('carpeta')
+    parser.add_argument('--modelo', default='G19',
+                        choices=[n for n, spec in REGISTRY.items() if head_features(spec)])
+    parser.add_argument('--almacen', default=None, help="por defecto, caracteristicas/<modelo>")
+    parser.add_argument('--cabeza', default=None, help="cabeza a evaluar (por defecto la fc del checkpoint)")
+    parser.add_argument('--etiquetadas', action='store_true', help="la carpeta tiene una subcarpeta por clase")
+    parser.add_argument('--salida', default='cabeza.pth')
+    parser.add_argument('--epocas', type=int, default=200)
+    args = parser.parse_args()
+
+    spec = REGISTRY[args.modelo]
+    store = open_store(spec, args.almacen)
+    labeled = args.etiquetadas or args.accion == 'entrenar'
+    if labeled:
+        samples = list(iter_labeled_images(args.carpeta))
+        paths, targets = [p for p, _ in samples], [c for _, c in samples]
+    else:
+        paths, targets = list(iter_image_paths(args.carpeta)), None
+    if not paths:
+        raise SystemExit(f"No hay imágenes en {args.carpeta}")
+
+    antes = len(store)
+    keys = [sha256_file(p) for p in paths]
+    if missing(keys, store):
+        extract(paths, keys, store, load_backbone(spec), spec)
+    failed = {k for k in keys if store.is_failed(k)}
+    print(f"{len(paths)} imágenes; {len(store) - antes} características nuevas, {len(store)} en {store.directorio}")
+    if failed:
+        print(f"{len(failed)} imágenes omitidas por no poder leerse")
+        kept = [i for i, k in enumerate(keys) if k not in failed]
+        keys = [keys[i] for i in kept]
+        targets = [targets[i] for i in kept] if targets else targets
+        if not keys:
+            raise SystemExit(f"No se pudo leer ninguna imagen de {args.carpeta}")
+    if args.accion == 'extraer':
+        return
+
+    features = store.get(keys)
+    if args.accion == 'entrenar':
+        y = torch.tensor([spec.class_names.index(c) for c in targets])
+        head = train_head(features, y, len(spec.class_names), args.epocas)
+        torch.save(head.state_dict(), args.salida)
+        with torch.no_grad():
+            acc = (head(features).argmax(1) == y).float().mean().item()
+        print(f"Cabeza guardada en {args.salida} (exactitud de entrenamiento {acc:.1%})")
+        return
+
+    fc = load_head(spec.checkpoint, store.dim)
+    head = load_head(args.cabeza, store.dim) if args.cabeza else fc
+    with torch.no_grad():
+        preds = head(features).argmax(1)
+        if args.cabeza:
+            agreement = (preds == fc(features).argmax(1)).float().mean().item()
+            print(f"Concordancia con la fc de {spec.name}: {agreement:.1%}")
+    labels = [spec.class_names[i] for i in preds.tolist()]
+    for name in spec.class_names:
+        print(f"{name}: {labels.count(name)}")
+    if targets:
+        acc = sum(l == t for l, t in zip(labels, targets)) / len(labels)
+        print(f"Exactitud: {acc:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Clasificación en cascada: un modelo rápido primero y G19 solo cuando duda.
+
+Uso (ajuste del umbral):
+    python cascada.py carpeta [--rapido MV3] [--preciso G19] [--umbrales 0.7 0.8 0.9 0.95]
+                              [--etiquetadas]
+
+``CascadeEngine`` clasifica cada lote con el modelo rápido (MobileNetV3-Small
+entrenada con las mismas nueve clases R5–R9, V1–V4) y vuelve a clasificar con
+el preciso solo las imágenes cuya probabilidad softmax máxima queda por debajo
+de ``threshold``. ``CascadeStats`` cuenta cuántas veces se recurre al modelo
+preciso y guarda un histograma de las confianzas, con el que se estima cuántas
+veces se recurriría con otro umbral.
+
+Desde la línea de comandos clasifica las fotos de ``carpeta`` con ambos
+modelos y, para cada umbral, imprime la fracción que iría a G19, la latencia
+estimada por imagen y la concordancia del resultado con G19 (o la exactitud,
+con ``--etiquetadas`` y una subcarpeta por clase).
+"""
+import argparse
+import threading
+import time
+import torch
+from motor_inferencia import config, iter_image_paths, iter_labeled_images, open_bytes
+
+
+class CascadeStats:
+    """Contadores del modo cascada (seguros entre hilos)."""
+
+    BINS = 20  # histograma de confianzas en pasos de 0.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.total = 0
+            self.fallbacks = 0
+            # Recurrencias en las que el modelo rápido ya había acertado la etiqueta de G19
+            self.agreements = 0
+            self.histogram = [0] * self.BINS
+
+    def record(self, confidences, fallback_mask, agreements):
+        with self._lock:
+            self.total += len(confidences)
+            self.fallbacks += int(fallback_mask.sum())
+            self.agreements += agreements
+            for c in confidences.tolist():
+                self.histogram[min(int(c * self.BINS), self.BINS - 1)] += 1
+
+    @property
+    def fallback_rate(self):
+        return self.fallbacks / self.total if self.total else 0.0
+
+    def fallback_rate_at(self, threshold):
+        """Fracción estimada (según el histograma) que iría a G19 con ``threshold``."""
+        if not self.total:
+            return 0.0
+        return sum(self.histogram[:round(threshold * self.BINS)]) / self.total
+
+    def summary(self):
+        agreement = self.agreements / self.fallbacks if self.fallbacks else 0.0
+        return (f"{self.total} imágenes, {self.fallbacks} a G19 ({self.fallback_rate:.1%}); "
+                f"el modelo rápido coincidía en {agreement:.1%} de ellas")
+
+
+class CascadeEngine:
+    """Motor con la misma interfaz que ``InferenceEngine`` que encadena dos motores."""
+
+    def __init__(self, fast, accurate, threshold=None, name=None):
+        self.fast = fast
+        self.accurate = accurate
+        self.threshold = config['cascade_threshold'] if threshold is None else threshold
+        self.name = name or f"{fast.name}>{accurate.name}"
+        self.class_names = accurate.class_names
+        # Quien prepara tensores por su cuenta (ej. benchmark_decodificacion.py) usa la transformación del modelo rápido
+        self.transform = fast.transform
+        self.tta_transform = None
+        self.scaled_decode = fast.scaled_decode
+        self.stats = CascadeStats()
+
+    def _decode(self, images):
+        # Si ambos modelos decodifican igual, cada ruta se lee y decodifica una sola vez. Se pasan
+        # imágenes y no tensores: cada motor aplica su caché, su preprocesamiento y su TTA
+        if self.fast.scaled_decode != self.accurate.scaled_decode:
+            return images
+        return [read_image(img, self.scaled_decode) if isinstance(img, str) else img for img in images]
+
+    def classify_batch(self, images, k=1):
+        """Como ``InferenceEngine.classify_batch``; solo las imágenes dudosas pasan por el modelo preciso."""
+        if len(images) == 0:
+            return [], torch.empty(0, k)
+        images = self._decode(images)
+        labels, probs = self.fast.classify_batch(images, k)
+        confidences = probs[:, 0]
+        fallback = confidences < self.threshold
+        indices = fallback.nonzero().flatten().tolist()
+        agreements = 0
+        if indices:
+            probs = probs.clone()  # los tensores de inference_mode no se modifican fuera de ella
+            accurate_labels, accurate_probs = self.accurate.classify_batch([images[i] for i in indices], k)
+            for i, label, p in zip(indices, accurate_labels, accurate_probs):
+                agreements += labels[i][0] == label[0]
+                labels[i] = label
+                probs[i] = p
+        self.stats.record(confidences, fallback, agreements)
+        return labels, probs
+
+    def classify_image(self, path_or_pil_image):
+        labels, _ = self.classify_batch([path_or_pil_image])
+        return labels[0][0]
+
+    def warmup(self, batch_size=1):
+        self.fast.warmup(batch_size)
+        self.accurate.warmup(batch_size)
+
+
+def read_image(path, scaled=False):
+    """``HashedImage`` del archivo ``path``: decodificada una vez y con el hash para la caché."""
+    with open(path, 'rb') as f:
+        return open_bytes(f.read(), scaled)
+
+
+def classify_all(engine, images, batch_size=8):
+    """Etiquetas top-1, confianzas y ms por imagen de ``engine`` sobre ``images``."""
+    labels, confidences = [], []
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        batch_labels, probs = engine.classify_batch(images[i:i + batch_size])
+        labels += [row[0] for row in batch_labels]
+        confidences.append(probs[:, 0])
+    elapsed = (time.perf_counter() - start) * 1000 / len(images)
+    return labels, torch.cat(confidences), elapsed
+
+
+def main():
+    from registro_modelos import load_engine
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('carpeta')
+    parser.add_argument('--rapido', default='MV3')
+    parser.add_argument('--preciso', default='G19')
+    parser.add_argument('--umbrales', type=float, nargs='+', default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99])
+    parser.add_argument('--etiquetadas', action='store_true', help="la carpeta tiene una subcarpeta por clase")
+    args = parser.parse_args()
+
+    fast, accurate = load_engine(args.rapido), load_engine(args.preciso)
+    fast.result_cache = accurate.result_cache = None  # se mide el forward real de cada modelo
+    if args.etiquetadas:
+        samples = list(iter_labeled_images(args.carpeta))
+        paths, targets = [p for p, _ in samples], [c for _, c in samples]
+    else:
+        paths, targets = list(iter_image_paths(args.carpeta)), None
+    if not paths:
+        raise SystemExit(f"No hay imágenes en {args.carpeta}")
+    # Se decodifica una vez; ambos modelos reciben las mismas imágenes (y aplican su TTA, si lo hay)
+    images = [read_image(p, fast.scaled_decode and accurate.scaled_decode) for p in paths]
+    fast_labels, confidences, fast_ms = classify_all(fast, images)
+    accurate_labels, _, accurate_ms = classify_all(accurate, images)
+    reference = targets or accurate_labels
+    medida = 'exactitud' if targets else 'concordancia con G19'
+
+    print(f"{len(paths)} imágenes; {args.rapido}: {fast_ms:.1f} ms/imagen, {args.preciso}: {accurate_ms:.1f} ms/imagen")
+    print(f"{'umbral':>7} {'a G19':>7} {'ms/imagen':>10} {medida:>22}")
+    for threshold in args.umbrales:
+        fallback = (confidences < threshold).tolist()
+        final = [a if f else r for r, a, f in zip(fast_labels, accurate_labels, fallback)]
+        rate = sum(fallback) / len(paths)
+        hits = sum(f == r for f, r in zip(final, reference)) / len(paths)
+        print(f"{threshold:>7.2f} {rate:>7.1%} {fast_ms + rate * accurate_ms:>10.1f} {hits:>22.1%}")
+    if targets:
+        g19 = sum(a == t for a, t in zip(accurate_labels, targets)) / len(paths)
+        print(f"Exactitud de {args.preciso} solo: {g19:.1%}")
+
+
+if __name__ == '__main__':
+    main()
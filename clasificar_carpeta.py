@@ -0,0 +1,135 @@
+"""Clasifica todas las imágenes de una carpeta sin interfaz ni cámara.
+
+Uso:
+    python clasificar_carpeta.py fotos_campo [--salida resultados.csv|resultados.jsonl] [--modelo G19]
+                                 [--lote 16] [--trabajadores 2] [--top 3]
+                                 [--backend ...] [--precision ...] [--tta ...]
+
+Recorre la carpeta (y sus subcarpetas) como un generador: los procesos de un
+DataLoader leen cada archivo, calculan su SHA-256 y lo decodifican mientras
+el proceso principal clasifica el lote anterior, y cada lote se escribe en la
+salida apenas se clasifica. El motor recibe las imágenes decodificadas con su
+hash (``HashedImage``), así que las fotos ya clasificadas salen de la caché de
+resultados y las demás se preprocesan en su buffer reutilizable. La memoria usada no depende del tamaño de la carpeta, solo del
+tamaño de lote y del número de trabajadores. El formato de salida se elige
+por la extensión: CSV (ruta, etapa, confianza) o JSON Lines (con las ``--top``
+clases más probables). Las imágenes que no se pueden abrir se informan en la
+salida con su error y no detienen el proceso.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+import motor_inferencia
+from motor_inferencia import iter_image_paths, open_bytes
+
+
+class ImageFolderStream(IterableDataset):
+    """Produce ``(ruta, HashedImage, error)`` de cada imagen de ``folder``, repartidas entre los trabajadores."""
+
+    def __init__(self, folder, scaled_decode=False):
+        self.folder = folder
+        self.scaled_decode = scaled_decode
+
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+        for i, path in enumerate(iter_image_paths(self.folder)):
+            if i % num_workers != worker_id:
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    yield path, open_bytes(f.read(), self.scaled_decode), None
+            except Exception as e:  # imagen corrupta o truncada
+                yield path, None, str(e)
+
+
+def collate(items):
+    # Se conservan listas: el motor preprocesa el lote de imágenes PIL
+    return items
+
+
+class ResultWriter:
+    """Escribe las filas de resultados en CSV o JSON Lines según la extensión de ``path``."""
+
+    def __init__(self, path):
+        self.jsonl = path.endswith('.jsonl')
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        if not self.jsonl:
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(['ruta', 'etapa', 'confianza', 'error'])
+
+    def write(self, path, labels=None, probs=None, error=None):
+        if self.jsonl:
+            row = {'ruta': path}
+            if error is None:
+                row.update(etapa=labels[0], confianza=round(probs[0], 4),
+                           top=[{'etapa': l, 'probabilidad': round(p, 4)} for l, p in zip(labels, probs)])
+            else:
+                row['error'] = error
+            self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        elif error is None:
+            self.csv.writerow([path, labels[0], f"{probs[0]:.4f}", ''])
+        else:
+            self.csv.writerow([path, '', '', error])
+
+    def close(self):
+        self.file.close()
+
+
+def classify_folder(engine, folder, writer, batch_size, num_workers, top=1):
+    """Clasifica ``folder`` con ``engine`` y escribe cada resultado; devuelve ``(clasificadas, errores)``."""
+    dataset = ImageFolderStream(folder, engine.scaled_decode)
+    loader = DataLoader(dataset, batch_size=batch_size,
+                        num_workers=num_workers, collate_fn=collate)
+    done = errors = 0
+    for items in loader:
+        ok = [(path, image) for path, image, error in items if error is None]
+        for path, _, error in items:
+            if error is not None:
+                writer.write(path, error=error)
+                errors += 1
+        if ok:
+            labels, probs = engine.classify_batch([image for _, image in ok], k=top)
+            for (path, _), row_labels, row_probs in zip(ok, labels, probs.tolist()):
+                writer.write(path, row_labels, row_probs)
+            done += len(ok)
+        writer.file.flush()
+    return done, errors
+
+
+def main():
+    from registro_modelos import REGISTRY, load_engine
+
+    # Al volver a clasificar una carpeta las fotos ya vistas salen de la caché (--cache-resultados 0 la desactiva)
+    motor_inferencia.config['result_cache_size'] = motor_inferencia.DEFAULT_RESULT_CACHE_SIZE
+    config = motor_inferencia.configure_from_args()  # --backend, --precision, --tta, --hilos, ...
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('carpeta')
+    parser.add_argument('--salida', default='resultados.csv', help="extensión .csv o .jsonl")
+    parser.add_argument('--modelo', choices=list(REGISTRY), default='G19')
+    parser.add_argument('--lote', type=int, default=config['batch_size'])
+    parser.add_argument('--trabajadores', type=int, default=min(2, os.cpu_count() or 1))
+    parser.add_argument('--top', type=int, default=1, help="clases más probables en la salida JSONL")
+    args, _ = parser.parse_known_args()
+    if not os.path.isdir(args.carpeta):
+        raise SystemExit(f"No existe la carpeta {args.carpeta}")
+
+    engine = load_engine(args.modelo)
+    writer = ResultWriter(args.salida)
+    start = time.perf_counter()
+    try:
+        done, errors = classify_folder(engine, args.carpeta, writer, args.lote, args.trabajadores, args.top)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"{done} imágenes clasificadas con {engine.name} en {elapsed:.1f} s "
+          f"({done / elapsed if elapsed else 0:.1f} imágenes/s); {errors} con error -> {args.salida}",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
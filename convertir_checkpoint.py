@@ -0,0 +1,141 @@
+"""Convierte los checkpoints .pth a un formato que se pueda mapear en memoria.
+
+Uso:
+    python convertir_checkpoint.py [--modelo G19] [--formato pth|safetensors] [--salida ruta] [--medir]
+
+En .pth (formato zip de ``torch.save``, que ``torch.load(mmap=True)`` puede
+mapear) guarda los pesos ya optimizados: BN plegadas en las convoluciones y
+pesos en channels_last, como los deja ``optimize_model``. ``load_model`` usa
+esos tensores mapeados tal cual; con un checkpoint sin optimizar tiene que
+copiar cada convolución al plegarla y el mapeo no ahorra nada.
+
+Por defecto el .pth convertido reemplaza al checkpoint registrado (ej.
+G19.pth), que es el que cargan todos los scripts; el original se conserva
+como G19_original.pth. Como cambia el hash del checkpoint, los artefactos
+derivados (.ts, _int8.ts, .onnx) se deben volver a exportar. En
+.safetensors (requiere el paquete ``safetensors``, que no guarda strides) el
+state_dict queda plano y contiguo, sin optimizar, en un archivo aparte.
+
+Con ``--medir`` carga el modelo en procesos separados como lo hacen los
+scripts (``motor_inferencia.load_model`` con backend eager) desde el
+checkpoint original y desde el convertido, y a la manera anterior
+(``torch.load`` completo + ``load_state_dict`` + ``optimize_model``); imprime
+la memoria residente (RSS) tras la carga y el pico hasta una primera
+inferencia.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import torch
+from motor_inferencia import is_folded, load_eager, load_safetensors, load_state_dict
+from optimizar_modelo import optimize_model
+from registro_modelos import REGISTRY
+
+try:
+    from safetensors.torch import save_file as save_safetensors
+except ImportError:  # safetensors es opcional
+    save_safetensors = None
+
+# Se ejecuta en un proceso nuevo. Tras los imports reinicia el pico de RSS del
+# proceso (VmHWM, escribiendo 5 en /proc/self/clear_refs) para que el pico de
+# importar torch no oculte el de la carga; imprime en KiB el RSS previo, el
+# RSS tras la carga y el pico hasta terminar una inferencia.
+_MEDIR = '''
+import sys, torch
+from registro_modelos import REGISTRY
+import motor_inferencia
+from optimizar_modelo import optimize_model
+def status(campo):
+    with open('/proc/self/status') as f:
+        return next(int(l.split()[1]) for l in f if l.startswith(campo))
+spec, checkpoint, modo = REGISTRY[sys.argv[1]], sys.argv[2], sys.argv[3]
+example = torch.zeros(1, 3, 224, 224).contiguous(memory_format=torch.channels_last)
+previo = status('VmRSS:')
+with open('/proc/self/clear_refs', 'w') as f:
+    f.write('5')
+if modo == 'antes':
+    model = spec.build()
+    model.load_state_dict(torch.load(checkpoint, map_location='cpu'))
+    model.eval()
+    optimize_model(model)
+else:
+    model = motor_inferencia.load_model(checkpoint, backend='eager', build=spec.build)
+cargado = status('VmRSS:')
+with torch.inference_mode():
+    model(example)
+print(previo, cargado, status('VmHWM:'))
+'''
+
+
+def convert(checkpoint, salida, formato, build):
+    """Guarda los pesos de ``checkpoint`` en ``salida``: optimizados en .pth, planos en .safetensors."""
+    state = torch.load(checkpoint, map_location='cpu', weights_only=False)
+    if isinstance(state, torch.nn.Module):  # checkpoints guardados con torch.save(model)
+        state = state.state_dict()
+    if formato == 'safetensors':
+        if save_safetensors is None:
+            raise SystemExit("Falta el paquete safetensors (pip install safetensors)")
+        # clone(): safetensors no admite tensores que compartan almacenamiento
+        save_safetensors({k: v.detach().contiguous().clone() for k, v in state.items()}, salida)
+        return
+    model = load_eager(build=build, state=state)
+    if not optimize_model(model):
+        raise SystemExit(f"La optimización de {checkpoint} cambia los logits; no se guarda {salida}")
+    # clone() sin contiguous(): conserva los strides channels_last de los pesos
+    tmp = f"{salida}.tmp"
+    torch.save({k: v.detach().clone() for k, v in model.state_dict().items()}, tmp)
+    os.replace(tmp, salida)  # atómico: un corte no deja el checkpoint a medias
+
+
+def measure_rss_mib(nombre, checkpoint, modo):
+    """``(RSS tras la carga, pico)`` en MiB sobre el proceso recién importado al cargar ``checkpoint`` en ``modo``."""
+    # Los módulos del proyecto se importan desde aquí; el checkpoint es relativo al cwd
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', _MEDIR, nombre, checkpoint, modo],
+                         check=True, capture_output=True, text=True, env=env)
+    previo, cargado, pico = map(int, out.stdout.split()[-3:])
+    return (cargado - previo) / 1024, (pico - previo) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modelo', choices=[n for n, spec in REGISTRY.items() if spec.checkpoint], default='G19')
+    parser.add_argument('--formato', choices=('pth', 'safetensors'), default='pth')
+    parser.add_argument('--salida', default=None)
+    parser.add_argument('--medir', action='store_true', help="medir el pico de RSS antes/después")
+    args = parser.parse_args()
+
+    spec = REGISTRY[args.modelo]
+    checkpoint = spec.checkpoint
+    stem = os.path.splitext(checkpoint)[0]
+    original = f'{stem}_original.pth'
+    salida = args.salida or (f'{stem}.safetensors' if args.formato == 'safetensors' else checkpoint)
+    if os.path.abspath(salida) == os.path.abspath(checkpoint):
+        if is_folded(load_state_dict(checkpoint)):
+            print(f"{checkpoint} ya está optimizado")
+        else:
+            if not os.path.exists(original):
+                shutil.copy2(checkpoint, original)
+            convert(original, salida, args.formato, spec.build)
+            print(f"{checkpoint} optimizado (original en {original}); vuelva a exportar sus .ts/.onnx")
+    else:
+        convert(checkpoint, salida, args.formato, spec.build)
+        print(f"{checkpoint} -> {salida}")
+
+    if args.medir:
+        # La carga anterior solo acepta el checkpoint sin plegar
+        source = original if os.path.exists(original) else checkpoint
+        tamano = os.path.getsize(source) / 2**20
+        print(f"Tamaño de {source}: {tamano:.0f} MiB")
+        casos = [('carga anterior', source, 'antes'), ('load_model', source, 'despues')]
+        if salida != source and not (salida.endswith('.safetensors') and load_safetensors is None):
+            casos.append(('load_model', salida, 'despues'))
+        for etiqueta, ruta, modo in casos:
+            cargado, pico = measure_rss_mib(args.modelo, ruta, modo)
+            print(f"{etiqueta} ({ruta}): RSS tras cargar +{cargado:.0f} MiB, pico con una inferencia +{pico:.0f} MiB")
+
+
+if __name__ == '__main__':
+    main()
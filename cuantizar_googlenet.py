@@ -0,0 +1,166 @@
+"""Cuantización estática post-entrenamiento (INT8) de G19 para equipos solo-CPU.
+
+Uso:
+    python cuantizar_googlenet.py --calibracion fotos_campo [--etiquetadas carpeta]
+                                  [--backend qnnpack|fbgemm] [--max-imagenes 200]
+
+Calibra los observadores con las fotos de ``--calibracion`` y guarda el modelo
+INT8 como TorchScript en G19_int8.ts, junto al hash de G19.pth y el backend de
+cuantización usado. Si se da ``--etiquetadas`` (una subcarpeta por clase, ej.
+R5/, V1/) imprime la exactitud fp32 vs INT8, su concordancia y la latencia de
+ambos antes de guardar, para validar el modelo antes de usar ``--precision int8``
+en campo. Las fotos que no se pueden leer se omiten y se cuentan.
+
+qnnpack es el backend para ARM (Raspberry Pi) y fbgemm el de x86; el modelo
+debe cuantizarse con el backend del equipo donde se va a ejecutar.
+"""
+import argparse
+import itertools
+import platform
+import time
+import torch
+import torch.nn as nn
+from torchvision.models import quantization
+from torchvision.models.quantization.googlenet import QuantizableBasicConv2d
+from motor_inferencia import (CHECKPOINT, class_names, iter_image_paths, iter_labeled_images, load_eager,
+                              load_model, quantized_path, sha256_file, transform_paths)
+
+
+def default_backend():
+    return 'qnnpack' if platform.machine().lower() in ('arm64', 'aarch64', 'armv7l') else 'fbgemm'
+
+
+def build_quantizable(checkpoint):
+    """GoogLeNet cuantizable (con QuantStub/DeQuantStub) con los pesos de ``checkpoint``.
+
+    Acepta también checkpoints optimizados por ``convertir_checkpoint.py``
+    (BN ya plegadas); ``load_eager`` pliega la red antes de asignar los pesos.
+    """
+    def build():
+        model = quantization.googlenet(weights=None, quantize=False, aux_logits=False, init_weights=False)
+        model.fc = nn.Linear(model.fc.in_features, len(class_names))
+        return model
+
+    return load_eager(checkpoint, build).to('cpu')
+
+
+def fuse(model):
+    """Fusiona conv+bn+relu de cada BasicConv2d, o solo conv+relu si las BN ya están plegadas."""
+    for module in model.modules():
+        if isinstance(module, QuantizableBasicConv2d):
+            names = ['conv', 'bn', 'relu'] if isinstance(module.bn, nn.BatchNorm2d) else ['conv', 'relu']
+            torch.ao.quantization.fuse_modules(module, names, inplace=True)
+
+
+def batches(paths, batch_size):
+    """Agrupa las imágenes legibles de ``paths`` en ``(rutas, tensor NCHW)`` ya transformados."""
+    decoded = transform_paths(paths)
+    while True:
+        chunk = list(itertools.islice(decoded, batch_size))
+        if not chunk:
+            return
+        yield [p for p, _ in chunk], torch.stack([t for _, t in chunk])
+
+
+def quantize(checkpoint, calibration_dir, backend, max_images=200, batch_size=8):
+    """Fusiona conv+bn+relu, calibra con ``calibration_dir`` y convierte a INT8."""
+    torch.backends.quantized.engine = backend
+    model = build_quantizable(checkpoint)
+    fuse(model)
+    model.qconfig = torch.ao.quantization.get_default_qconfig(backend)
+    torch.ao.quantization.prepare(model, inplace=True)
+
+    paths = list(itertools.islice(iter_image_paths(calibration_dir), max_images))
+    if not paths:
+        raise SystemExit(f"No hay imágenes de calibración en {calibration_dir}")
+    used = 0
+    with torch.inference_mode():
+        for chunk, batch in batches(paths, batch_size):
+            model(batch)
+            used += len(chunk)
+    if not used:
+        raise SystemExit(f"No se pudo leer ninguna imagen de calibración de {calibration_dir}")
+    torch.ao.quantization.convert(model, inplace=True)
+    skipped = f", {len(paths) - used} ilegibles omitidas" if used < len(paths) else ""
+    print(f"Calibrado con {used} imágenes de {calibration_dir} (backend {backend}{skipped})")
+    return model
+
+
+def save_quantized(model, checkpoint, salida, backend):
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.randn(1, 3, 224, 224))
+    frozen = torch.jit.freeze(traced)
+    torch.jit.save(frozen, salida, _extra_files={
+        'checkpoint_sha256': sha256_file(checkpoint),
+        'qengine': backend,
+    })
+
+
+def latency_ms(model, runs=20):
+    """Mediana de la latencia por imagen (lote de 1), en milisegundos."""
+    x = torch.randn(1, 3, 224, 224)
+    times = []
+    with torch.inference_mode():
+        model(x)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(x)
+            times.append((time.perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def compare(fp32_model, int8_model, labeled_dir, batch_size=8):
+    """Exactitud de ambos modelos sobre ``labeled_dir`` y tasa de concordancia."""
+    samples = list(iter_labeled_images(labeled_dir))
+    if not samples:
+        print(f"No hay imágenes etiquetadas en {labeled_dir}")
+        return
+    labels = dict(samples)
+    targets, preds_fp32, preds_int8 = [], [], []
+    with torch.inference_mode():
+        for chunk, batch in batches(labels, batch_size):
+            targets.extend(class_names.index(labels[p]) for p in chunk)
+            preds_fp32.append(fp32_model(batch).argmax(1))
+            preds_int8.append(int8_model(batch).argmax(1))
+    if not targets:
+        print(f"No se pudo leer ninguna imagen etiquetada de {labeled_dir}")
+        return
+    targets = torch.tensor(targets)
+    preds_fp32 = torch.cat(preds_fp32)
+    preds_int8 = torch.cat(preds_int8)
+    acc_fp32 = (preds_fp32 == targets).float().mean().item() * 100
+    acc_int8 = (preds_int8 == targets).float().mean().item() * 100
+    agreement = (preds_fp32 == preds_int8).float().mean().item() * 100
+    skipped = len(labels) - len(targets)
+    print(f"Imágenes etiquetadas: {len(targets)}" + (f" ({skipped} ilegibles omitidas)" if skipped else ""))
+    print(f"Exactitud fp32: {acc_fp32:.2f} %")
+    print(f"Exactitud int8: {acc_int8:.2f} %  (Δ {acc_int8 - acc_fp32:+.2f} puntos)")
+    print(f"Concordancia fp32/int8: {agreement:.2f} %")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--calibracion', default='fotos_campo', help="carpeta con fotos de calibración")
+    parser.add_argument('--etiquetadas', default=None, help="carpeta con una subcarpeta por clase")
+    parser.add_argument('--backend', choices=('qnnpack', 'fbgemm'), default=default_backend())
+    parser.add_argument('--max-imagenes', type=int, default=200)
+    parser.add_argument('--salida', default=None, help="por defecto, G19_int8.ts junto al checkpoint")
+    args = parser.parse_args()
+
+    int8_model = quantize(args.checkpoint, args.calibracion, args.backend, args.max_imagenes)
+
+    # Se mide y compara antes de guardar: el G19_int8.ts anterior sigue en su sitio si algo falla aquí
+    fp32_model = load_model(args.checkpoint, backend='eager').to('cpu')
+    print(f"Latencia fp32: {latency_ms(fp32_model):.1f} ms/imagen")
+    print(f"Latencia int8: {latency_ms(int8_model):.1f} ms/imagen")
+    if args.etiquetadas:
+        compare(fp32_model, int8_model, args.etiquetadas)
+
+    salida = args.salida or quantized_path(args.checkpoint)
+    save_quantized(int8_model, args.checkpoint, salida, args.backend)
+    print(f"Modelo INT8 guardado en {salida}")
+
+
+if __name__ == '__main__':
+    main()
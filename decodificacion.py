@@ -0,0 +1,118 @@
+"""Decodificación JPEG reducida en el dominio DCT (``Image.draft``) para el modelo y la vista previa.
+
+Las capturas de campo son de 1280x960, pero el modelo solo usa una versión de
+lado corto 256 (``Resize(256)``) y la vista previa una del tamaño de la
+ventana. ``Image.draft`` le pide a libjpeg que decodifique directamente a 1/2,
+1/4 o 1/8 del tamaño, lo que ahorra la mayor parte del trabajo de la
+decodificación y de la memoria de la imagen completa. Siempre se elige la
+mayor reducción que deja la imagen al menos del tamaño pedido, así que el
+redimensionamiento posterior (``Resize(256)`` o ``thumbnail``) sigue
+reduciendo, nunca ampliando. Para archivos que no son JPEG ``draft`` no hace
+nada y la imagen se decodifica completa.
+
+``CaptureFrame`` decodifica una captura una sola vez, a la escala que sirve a
+la vez al modelo y a la vista previa, y entrega ambas a partir de ese único
+buffer RGB.
+
+Este módulo no importa torch: lo usa también el hilo de captura.
+"""
+import math
+from PIL import Image
+
+# Lado corto de la imagen antes del recorte central (transforms.Resize(256))
+MODEL_SHORT_SIDE = 256
+
+
+def as_rgb(image):
+    """``image`` decodificada en RGB; ``convert`` copia aun si ya es RGB, así que solo se usa si hace falta."""
+    if image.mode == 'RGB':
+        image.load()
+        return image
+    return image.convert('RGB')
+
+
+def open_scaled(path, max_size):
+    """Abre ``path`` en RGB a la menor escala que no queda por debajo de su ``thumbnail(max_size)``."""
+    image = Image.open(path)
+    width, height = image.size
+    ratio = min(max_size[0] / width, max_size[1] / height)
+    if ratio < 1:
+        image.draft('RGB', (max(1, math.ceil(width * ratio)), max(1, math.ceil(height * ratio))))
+    return as_rgb(image)
+
+
+def draft_size(size, short_side=MODEL_SHORT_SIDE, preview_size=None):
+    """Menor tamaño que necesitan el modelo (lado corto >= ``short_side``) y la vista previa.
+
+    ``preview_size`` es la caja de la miniatura en la orientación de la foto
+    (ya intercambiada si se muestra rotada).
+    """
+    width, height = size
+    scale = short_side / min(width, height)
+    if preview_size is not None:
+        scale = max(scale, min(preview_size[0] / width, preview_size[1] / height))
+    return math.ceil(width * scale), math.ceil(height * scale)
+
+
+def open_for_model(path, short_side=MODEL_SHORT_SIDE):
+    """Abre ``path`` a la menor escala con lado corto >= ``short_side`` (sin cambiar la proporción)."""
+    image = Image.open(path)
+    width, height = image.size
+    scale = short_side / min(width, height)
+    image.draft('RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+    return as_rgb(image)
+
+
+class CaptureFrame:
+    """Una captura decodificada una sola vez, con vistas derivadas para el modelo y la vista previa.
+
+    ``source`` es una ruta o un archivo abierto. La imagen se decodifica con
+    ``draft`` a la menor escala que no queda por debajo ni de lo que necesita
+    el modelo (lado corto >= 256) ni de la miniatura de ``preview_size`` (la
+    caja de la ventana, que muestra la foto rotada -90°), y ese es el único
+    buffer RGB de la captura:
+
+    - ``image`` va tal cual al motor, que la reduce con ``Resize(256)``.
+    - ``preview(size)`` reduce primero y rota después, así que nunca crea una
+      copia rotada del tamaño completo.
+
+    Memoria de píxeles por captura de 1280x960 con una ventana de 780x400
+    (sin contar los tensores del modelo):
+
+    - Decodificando completa: 3,5 MiB de la imagen, otros 3,5 MiB de la rotada
+      y de su copia para ``thumbnail`` y la copia de ``convert('RGB')`` del
+      motor, unos 14 MiB.
+    - Con ``open_scaled`` y ``open_for_model``: dos decodificaciones de
+      640x480 (900 KiB cada una) con sus copias de ``convert``, más la rotada
+      y su copia, unos 4,4 MiB.
+    - Con ``CaptureFrame``: un buffer de 640x480 (900 KiB), la miniatura de
+      400x300 y su versión rotada (350 KiB cada una) y el ``Resize(256)`` del
+      motor (256 KiB), menos de 2 MiB. Si la caché de resultados está activa,
+      el hash del contenido hace además una copia transitoria del buffer.
+    """
+
+    def __init__(self, source, preview_size=None, short_side=MODEL_SHORT_SIDE):
+        image = Image.open(source)
+        box = preview_size[::-1] if preview_size is not None else None
+        image.draft('RGB', draft_size(image.size, short_side, box))
+        self.image = as_rgb(image)
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def nbytes(self):
+        """Memoria de los píxeles decodificados."""
+        return self.image.size[0] * self.image.size[1] * len(self.image.getbands())
+
+    def preview(self, size):
+        """Miniatura rotada -90° que cabe en ``size`` (sin ampliar), como ``rotate`` + ``thumbnail``."""
+        width, height = self.image.size
+        # Antes de rotar, el ancho de la ventana corresponde al alto de la foto
+        ratio = min(size[1] / width, size[0] / height)
+        image = self.image
+        if ratio < 1:
+            image = image.resize((max(1, round(width * ratio)), max(1, round(height * ratio))),
+                                 Image.LANCZOS, reducing_gap=2.0)
+        return image.transpose(Image.Transpose.ROTATE_270)
@@ -0,0 +1,72 @@
+"""Mide el costo de la clasificación con TTA (fivecrop / tencrop) frente a un solo recorte.
+
+Uso:
+    python evaluar_tta.py [--fotos fotos_campo] [--etiquetadas carpeta] [--repeticiones 10]
+
+Clasifica una captura a la vez, como la interfaz, con cada modo de TTA e
+imprime la mediana de la latencia y el sobrecosto respecto del recorte
+central. Si no hay fotos usa una imagen sintética de 1280x960 como las
+capturas de campo. Con ``--etiquetadas`` (una subcarpeta por clase) imprime
+además la exactitud de cada modo.
+"""
+import argparse
+import itertools
+import time
+from PIL import Image
+from motor_inferencia import MultiCropTransform, TTA_MODES, create_engine, iter_image_paths, iter_labeled_images, to_rgb
+
+
+def set_mode(engine, mode):
+    engine.tta_transform = None if mode == 'off' else MultiCropTransform(flip=mode == 'tencrop')
+
+
+def latency_ms(engine, images, repeticiones):
+    """Mediana de la latencia de ``classify_image`` (transformación incluida), en milisegundos."""
+    times = []
+    for img in itertools.islice(itertools.cycle(images), repeticiones):
+        start = time.perf_counter()
+        engine.classify_image(img)
+        times.append((time.perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def accuracy(engine, samples, batch_size=8):
+    hits = 0
+    for i in range(0, len(samples), batch_size):
+        chunk = samples[i:i + batch_size]
+        labels, _ = engine.classify_batch([to_rgb(p) for p, _ in chunk])
+        hits += sum(row[0] == c for row, (_, c) in zip(labels, chunk))
+    return hits / len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fotos', default='fotos_campo')
+    parser.add_argument('--etiquetadas', default=None, help="carpeta con una subcarpeta por clase")
+    parser.add_argument('--repeticiones', type=int, default=10)
+    args = parser.parse_args()
+
+    engine = create_engine()
+    engine.result_cache = None  # se mide cada forward, no la caché
+    engine.warmup()
+    # Imágenes ya decodificadas: se mide transformación + forward, no la lectura del disco
+    images = [to_rgb(p) for p in itertools.islice(iter_image_paths(args.fotos), args.repeticiones)]
+    if not images:
+        print(f"No hay fotos en {args.fotos}; se usa una imagen sintética de 1280x960")
+        images = [Image.new('RGB', (1280, 960), (90, 140, 60))]
+    samples = list(iter_labeled_images(args.etiquetadas)) if args.etiquetadas else []
+
+    base = None
+    for mode in TTA_MODES:
+        set_mode(engine, mode)
+        engine.classify_image(images[0])  # warm-up con el tamaño de lote de este modo
+        ms = latency_ms(engine, images, args.repeticiones)
+        base = base or ms
+        line = f"{mode:9s} {ms:7.1f} ms/captura  ({ms / base:.2f}x)"
+        if samples:
+            line += f"  exactitud {accuracy(engine, samples):.1%}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
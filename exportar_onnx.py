@@ -0,0 +1,71 @@
+"""Exporta los modelos del registro (G19, R23, MV3) a ONNX para ejecutarlos con ONNX Runtime.
+
+Uso:
+    python exportar_onnx.py [--modelo G19|R23|MV3|todos]
+
+Los modelos y sus checkpoints salen de ``registro_modelos.REGISTRY`` (las
+cascadas no se exportan: cada etapa tiene su propio archivo); con ``todos``
+se omiten los que no tienen checkpoint en disco. Genera G19.onnx, R23.onnx,
+etc. con el tamaño de lote dinámico y guarda en sus
+metadatos el SHA-256 del checkpoint de origen, que ``motor_inferencia``
+verifica antes de usar ``--backend onnx``. Requiere el paquete ``onnx``; si
+``onnxruntime`` está instalado también compara los logits contra PyTorch.
+"""
+import argparse
+import onnx
+import torch
+from motor_inferencia import load_eager, onnx_path, onnxruntime, sha256_file, OnnxRuntimeBackend
+from registro_modelos import REGISTRY
+
+# Solo los modelos con arquitectura propia; una cascada se exporta exportando sus etapas
+MODELOS = {name: spec for name, spec in REGISTRY.items() if spec.build is not None}
+
+
+def export_onnx(build, checkpoint, salida, tolerancia=1e-4):
+    """Exporta el modelo de ``checkpoint`` a ``salida`` y devuelve la diferencia máxima vs PyTorch."""
+    model = load_eager(checkpoint, build).to('cpu')  # acepta también checkpoints ya optimizados
+    ejemplo = torch.randn(2, 3, 224, 224)
+    torch.onnx.export(
+        model, (ejemplo,), salida,
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        dynamo=False
+    )
+    proto = onnx.load(salida)
+    entry = proto.metadata_props.add()
+    entry.key = 'checkpoint_sha256'
+    entry.value = sha256_file(checkpoint)
+    onnx.save(proto, salida)
+
+    if onnxruntime is None:
+        return None
+    with torch.inference_mode():
+        esperado = model(ejemplo)
+    diferencia = (OnnxRuntimeBackend(salida)(ejemplo) - esperado).abs().max().item()
+    if diferencia > tolerancia:
+        raise RuntimeError(f"{salida} difiere de PyTorch (max |Δ| = {diferencia:.2e})")
+    return diferencia
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modelo', choices=[*MODELOS, 'todos'], default='todos')
+    args = parser.parse_args()
+    nombres = list(MODELOS) if args.modelo == 'todos' else [args.modelo]
+    for nombre in nombres:
+        spec = MODELOS[nombre]
+        if not spec.available():
+            if args.modelo != 'todos':
+                raise SystemExit(f"No existe {spec.checkpoint}")
+            print(f"{nombre}: se omite, no existe {spec.checkpoint}")
+            continue
+        salida = onnx_path(spec.checkpoint)
+        diferencia = export_onnx(spec.build, spec.checkpoint, salida)
+        if diferencia is None:
+            print(f"{nombre}: guardado en {salida} (sin verificar, falta onnxruntime)")
+        else:
+            print(f"{nombre}: guardado en {salida} (max |Δ| vs PyTorch = {diferencia:.2e})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Exporta G19.pth a un artefacto TorchScript congelado para arrancar más rápido.
+
+Uso:
+    python exportar_torchscript.py [--checkpoint G19.pth] [--salida G19.ts] [--entrada uint8|float01]
+
+El artefacto guarda el SHA-256 del checkpoint de origen; ``motor_inferencia``
+solo lo usa si ese hash coincide con el checkpoint presente, de modo que al
+reemplazar G19.pth el programa vuelve al modelo eager hasta reexportar.
+Conviene exportar en el mismo tipo de equipo donde se va a usar (ARM/x86).
+
+Con ``--entrada uint8`` (o ``float01``) la normalización de ImageNet se pliega
+en los pesos y el sesgo de la primera convolución y el artefacto (G19_uint8.ts)
+recibe los píxeles sin normalizar; lo usa ``--entrada`` del mismo formato.
+"""
+import argparse
+import torch
+from motor_inferencia import (CHECKPOINT, INPUT_FORMATS, INPUT_SCALES, MEAN, STD, load_model, sha256_file,
+                              torchscript_path)
+
+
+def example_input(input_format, device):
+    """Lote de ejemplo en ``input_format`` y el mismo lote normalizado, para comparar con el modelo original."""
+    generator = torch.Generator().manual_seed(0)
+    pixels = torch.randint(0, 256, (2, 3, 224, 224), generator=generator, dtype=torch.uint8).to(device)
+    mean = torch.tensor(MEAN, device=device)[:, None, None]
+    std = torch.tensor(STD, device=device)[:, None, None]
+    normalized = (pixels.float() / 255 - mean) / std
+    if input_format == 'normalized':
+        return normalized, normalized
+    return (pixels if input_format == 'uint8' else pixels.float() / INPUT_SCALES['uint8']), normalized
+
+
+def export_torchscript(checkpoint, salida, tolerancia=1e-4, input_format='normalized'):
+    """Traza, congela y guarda el modelo; verifica que los logits coinciden con eager."""
+    reference = load_model(checkpoint, backend='eager')
+    model = load_model(checkpoint, backend='eager', input_format=input_format)
+    ejemplo, normalizado = example_input(input_format, next(reference.parameters()).device)
+    with torch.inference_mode():
+        esperado = reference(normalizado)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, ejemplo)
+    frozen = torch.jit.freeze(traced)
+    with torch.inference_mode():
+        diferencia = (frozen(ejemplo) - esperado).abs().max().item()
+    if diferencia > tolerancia:
+        raise RuntimeError(f"El artefacto difiere del modelo eager (max |Δ| = {diferencia:.2e})")
+    torch.jit.save(frozen, salida, _extra_files={'checkpoint_sha256': sha256_file(checkpoint),
+                                                 'input_format': input_format})
+    return diferencia
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--salida', default=None, help="por defecto, el checkpoint con extensión .ts")
+    parser.add_argument('--entrada', choices=INPUT_FORMATS, default='normalized',
+                        help="uint8/float01: plegar la normalización en la primera convolución")
+    args = parser.parse_args()
+    salida = args.salida or torchscript_path(args.checkpoint, args.entrada)
+    diferencia = export_torchscript(args.checkpoint, salida, input_format=args.entrada)
+    print(f"Artefacto guardado en {salida} (max |Δ| vs eager = {diferencia:.2e})")
+
+
+if __name__ == '__main__':
+    main()
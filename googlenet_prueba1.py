@@ -3,27 +3,8 @@ from tkinter import font
 import os
 from datetime import datetime
 from PIL import Image, ImageTk
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
 import subprocess
-
-# --- Configuración modelo ---
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-class_names = ['clase0','clase1','clase2','clase3','clase4','clase5','clase6','clase7','clase8']
-model = models.googlenet(weigths=None, aux_logits=False)  # Desactiva los clasificadores auxiliares
-model.fc = nn.Linear(model.fc.in_features, len(class_names))
-model.load_state_dict(torch.load('G19.pth', map_location=device))
-model.to(device)
-model.eval()
-
-# --- Transformación de imagen ---
-transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+from trabajador_captura import load_default_classifier, staged_boot
 
 # --- Interfaz Tkinter ---
 BASE_FONT_SIZE = 14
@@ -78,14 +59,6 @@ root.update_idletasks()
 
 last_photo_path = None
 
-def classify_image(path):
-    img = Image.open(path).convert('RGB')
-    tensor = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        out = model(tensor)
-        _, pred = torch.max(out,1)
-    return class_names[pred.item()]
-
 def tomar_y_clasificar():
     global last_photo_path
     status_label.config(text='Capturando imagen...')
@@ -134,4 +107,6 @@ def limpiar():
     capture_btn.config(state=tk.NORMAL)
     clear_btn.config(state=tk.DISABLED)
 
+# Arranque escalonado (ver trabajador_captura): la ventana aparece antes de cargar G19
+classify_image = staged_boot(root, load_default_classifier, status_label, capture_btn)
 root.mainloop()
\ No newline at end of file
@@ -3,15 +3,10 @@ from tkinter import font
 import os
 from datetime import datetime
 from PIL import Image, ImageTk
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
 import subprocess
+from trabajador_captura import load_default_classifier, staged_boot
 
 # --- Configuración modelo ---
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-# Nuevos nombres de clases
-class_names = ['R5', 'R6', 'R7', 'R8', 'R9', 'V1', 'V2', 'V3', 'V4']
 
 # Textos descriptivos para cada clase
 class_descriptions = {
@@ -27,19 +22,6 @@ class_descriptions = {
 }
 
 
-model = models.googlenet(weights=None, aux_logits=False)  # Desactiva los clasificadores auxiliares
-model.fc = nn.Linear(model.fc.in_features, len(class_names)) # len(class_names) sigue siendo 9
-model.load_state_dict(torch.load('G19.pth', map_location=device)) # Asegúrate que G19.pth fue entrenado para 9 clases
-model.to(device)
-model.eval()
-
-# --- Transformación de imagen ---
-transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
 
 # --- Interfaz Tkinter ---
 BASE_FONT_SIZE = 14
@@ -94,14 +76,6 @@ root.update_idletasks()
 
 last_photo_path = None
 
-def classify_image(path):
-    img = Image.open(path).convert('RGB')
-    tensor = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        out = model(tensor)
-        _, pred = torch.max(out,1)
-    return class_names[pred.item()] # Devuelve el nombre de la clase, ej: 'R5'
-
 def tomar_y_clasificar():
     global last_photo_path
     status_label.config(text='Capturando imagen...')
@@ -177,4 +151,6 @@ def limpiar():
     capture_btn.config(state=tk.NORMAL)
     clear_btn.config(state=tk.DISABLED)
 
+# Arranque escalonado (ver trabajador_captura): la ventana aparece antes de cargar G19
+classify_image = staged_boot(root, load_default_classifier, status_label, capture_btn)
 root.mainloop()
\ No newline at end of file
@@ -1,16 +1,11 @@
 import tkinter as tk
 import tkinter.font as tkfont
-from PIL import Image, ImageTk
-import os
-from datetime import datetime
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
+from PIL import ImageTk
 import subprocess
+from camara_continua import camera_from_args
+from trabajador_captura import CaptureWorker, retention_from_args
 
 # --- Configuración modelo ---
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-class_names = ['R5', 'R6', 'R7', 'R8', 'R9', 'V1', 'V2', 'V3', 'V4']
 class_descriptions = {
     'R5': "Inicio de la floración; se observan las primeras flores abiertas.",
     'R6': "Floración plena; la mayoría de las plantas tienen flores.",
@@ -23,18 +18,17 @@ class_descriptions = {
     'V4': "Desarrollo del tercer par de hojas trifoliadas; la planta continúa acumulando biomasa"
 }
 
-model = models.googlenet(weights=None, aux_logits=False)
-model.fc = nn.Linear(model.fc.in_features, len(class_names))
-model.load_state_dict(torch.load('G19.pth', map_location=device))
-model.to(device)
-model.eval()
+MODELO_INICIAL = 'G19'
+switcher = None  # Modelo activo (registro_modelos.ModelSwitcher), creado por el trabajador
 
-transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+def cargar_clasificador():
+    """``load_classifier`` del trabajador: crea el ModelSwitcher con el modelo inicial (ver trabajador_captura)."""
+    global switcher
+    import motor_inferencia
+    from registro_modelos import ModelSwitcher
+    motor_inferencia.configure_from_args()  # ej: --precision int8
+    switcher = ModelSwitcher(MODELO_INICIAL)
+    return switcher.classify_image
 
 # --- Interfaz Tkinter ---
 BASE_FONT_SIZE   = 20-8    # Tamaño base de fuente para textos generales
@@ -131,7 +125,8 @@ capture_btn = tk.Button(
     button_frame,
     text='Tomar Foto',
     font=tkfont.Font(family=BUTTON_FONT_FAM, size=BUTTON_FONT_SIZE, weight='bold'),
-    command=lambda: tomar_y_clasificar()
+    command=lambda: tomar_y_clasificar(),
+    state=tk.DISABLED  # Se habilita cuando el modelo está listo
 )
 capture_btn.grid(row=0, column=0, sticky="ew", pady=(0, 4))
 
@@ -145,83 +140,98 @@ clear_btn = tk.Button(
 )
 clear_btn.grid(row=1, column=0, sticky="ew")
 
-last_photo_path = None
-current_pil_image = None  # Para guardar la imagen PIL original
-resize_job = None         # Para el debounce del redimensionamiento
-
-def classify_image(path_or_pil_image):
-    if isinstance(path_or_pil_image, str):
-        img = Image.open(path_or_pil_image).convert('RGB')
-    elif isinstance(path_or_pil_image, Image.Image):
-        img = path_or_pil_image.convert('RGB')
-    else:
-        raise ValueError("Se espera una ruta de archivo o un objeto PIL.Image")
-
-    tensor = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        out = model(tensor)
-        _, pred = torch.max(out, 1)
-    return class_names[pred.item()]
-
-def display_image(pil_img_to_display):
-    """Muestra una imagen PIL en image_label, rotada y redimensionada."""
-    # 1. Rotar 90° a la derecha
-    pil_img_to_display = pil_img_to_display.rotate(-90, expand=True)
-
-    global current_pil_image
-    current_pil_image = pil_img_to_display  # Guardar para redimensionado posterior
+# Selector de modelo (se llena con el registro cuando el modelo inicial está listo)
+model_var = tk.StringVar(value=MODELO_INICIAL)
+model_menu = tk.OptionMenu(button_frame, model_var, MODELO_INICIAL)
+model_menu.config(font=tkfont.Font(family=BUTTON_FONT_FAM, size=BUTTON_FONT_SIZE), state=tk.DISABLED)
+model_menu.grid(row=2, column=0, sticky="ew", pady=(4, 0))
 
+current_frame = None  # CaptureFrame de la foto mostrada, para redimensionar la miniatura
+resize_job = None         # Para el debounce del redimensionamiento
+# Por defecto las fotos solo se usan para clasificar y se descartan al limpiar: nunca se escriben
+# en la SD. --conservar always las guarda en fotos/ (en segundo plano)
+# Cámara continua (libcamera-vid) salvo --camara por-captura|simulada
+worker = CaptureWorker(cargar_clasificador, save_dir='fotos', capture=camera_from_args(),
+                       retention=retention_from_args('never'))
+
+def preview_size():
+    """Tamaño máximo de la miniatura según el espacio disponible en image_label."""
     image_label.update_idletasks()
     max_w = image_label.winfo_width() - 10
     max_h = image_label.winfo_height() - 10
-
     if max_w <= 10 or max_h <= 10:
-        img_copy = current_pil_image.copy()
-        img_copy.thumbnail((INITIAL_SCREEN_WIDTH * 0.5, INITIAL_SCREEN_HEIGHT * 0.5), Image.LANCZOS)
-    else:
-        img_copy = current_pil_image.copy()
-        img_copy.thumbnail((max_w, max_h), Image.LANCZOS)
+        return (INITIAL_SCREEN_WIDTH // 2, INITIAL_SCREEN_HEIGHT // 2)
+    return (max_w, max_h)
 
-    tk_img = ImageTk.PhotoImage(img_copy)
+def display_image(frame, thumbnail):
+    """Muestra la miniatura ya rotada y redimensionada por el trabajador."""
+    global current_frame
+    current_frame = frame  # Guardar para redimensionado posterior
+
+    tk_img = ImageTk.PhotoImage(thumbnail)
     image_label.config(image=tk_img, text='')
     image_label.image = tk_img
 
 def tomar_y_clasificar():
-    global last_photo_path, current_pil_image
+    """Encola una captura; el trabajador la procesa sin bloquear el mainloop."""
     stage_label.config(text='')
     status_label.config(text='Capturando imagen...', font=tkfont.Font(family=DESC_FONT_FAM, size=DESC_FONT_SIZE))
-    root.update_idletasks()
-
-    save_dir = 'fotos'
-    os.makedirs(save_dir, exist_ok=True)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    ruta = os.path.join(save_dir, f'captura_{timestamp}.jpg')
-    try:
-        subprocess.run(
-            ['libcamera-jpeg', '-n', '-o', ruta, '-t', '200', '--width', '1280', '--height', '960'],
-            check=True
-        )
-    except FileNotFoundError:
-        status_label.config(text='Error: libcamera-jpeg no encontrado.')
+    worker.submit(preview_size())
+
+def mensaje_error(etapa, e):
+    if etapa == 'modelo':
+        return f'Error al cargar el modelo: {e}'
+    if etapa == 'captura':
+        if isinstance(e, FileNotFoundError):
+            return 'Error: libcamera no encontrado.'
+        if isinstance(e, subprocess.CalledProcessError):
+            return f'Error al capturar: {e}'
+        return f'Error captura general: {e}'
+    if etapa == 'mostrar':
+        return f'Error al mostrar imagen: {e}'
+    return f'Error al clasificar: {e}'
+
+def cambiar_modelo(nombre):
+    """Pide el cambio de modelo; el actual sigue clasificando hasta que el nuevo esté listo."""
+    model_var.set(nombre)
+    if nombre == switcher.name:
         return
-    except subprocess.CalledProcessError as e:
-        status_label.config(text=f'Error al capturar: {e}')
-        return
-    except Exception as e:
-        status_label.config(text=f'Error captura general: {e}')
-        return
-
-    try:
-        pil_image = Image.open(ruta)
-        display_image(pil_image)
-    except Exception as e:
-        status_label.config(text=f'Error al mostrar imagen: {e}')
-        return
-
-    status_label.config(text='Clasificando...', font=tkfont.Font(family=DESC_FONT_FAM, size=DESC_FONT_SIZE))
-    root.update_idletasks()
-    try:
-        predicted_class_name = classify_image(pil_image)
+    model_menu.config(state=tk.DISABLED)
+    status_label.config(text=f'Cargando modelo {nombre}...')
+    # El aviso llega desde el hilo de carga; se encola junto a los eventos del trabajador
+    switcher.swap(nombre, on_done=lambda n, e: worker.events.put(('modelo', (n, e))))
+
+def llenar_menu_modelos():
+    from registro_modelos import REGISTRY
+    menu = model_menu['menu']
+    menu.delete(0, 'end')
+    for nombre, spec in REGISTRY.items():
+        # Los modelos sin checkpoint en disco aparecen deshabilitados
+        menu.add_command(label=nombre, command=lambda n=nombre: cambiar_modelo(n),
+                         state=tk.NORMAL if spec.available() else tk.DISABLED)
+    model_menu.config(state=tk.NORMAL)
+
+def on_worker_event(tipo, dato):
+    """Aplica en la interfaz los eventos publicados por el trabajador (hilo de Tk)."""
+    if tipo == 'estado':
+        status_label.config(text=dato, font=tkfont.Font(family=DESC_FONT_FAM, size=DESC_FONT_SIZE))
+    elif tipo == 'listo':
+        status_label.config(text='Esperando acción...')
+        capture_btn.config(state=tk.NORMAL)
+        llenar_menu_modelos()
+    elif tipo == 'modelo':
+        nombre, e = dato
+        if e is None:
+            status_label.config(text=f'Modelo activo: {nombre}')
+        else:
+            status_label.config(text=f'Error al cargar el modelo {nombre}: {e}')
+        model_var.set(switcher.name)
+        model_menu.config(state=tk.NORMAL)
+    elif tipo == 'imagen':
+        _, frame, thumbnail = dato
+        display_image(frame, thumbnail)
+    elif tipo == 'resultado':
+        _, predicted_class_name = dato
         description = class_descriptions.get(
             predicted_class_name,
             f"Descripción no encontrada para: {predicted_class_name}"
@@ -229,23 +239,18 @@ def tomar_y_clasificar():
         # Mostrar la etapa clasificada
         stage_label.config(text=f"Etapa: {predicted_class_name}")
         status_label.config(text=description)
-    except Exception as e:
-        status_label.config(text=f'Error al clasificar: {e}')
-        return
-
-    capture_btn.config(state=tk.DISABLED)
-    clear_btn.config(state=tk.NORMAL)
-    last_photo_path = ruta
+        if not worker.pending():
+            capture_btn.config(state=tk.DISABLED)
+        clear_btn.config(state=tk.NORMAL)
+        stats = getattr(switcher.engine, 'stats', None)
+        if stats is not None:  # modo cascada: cuántas capturas necesitaron G19
+            print(f"Cascada {switcher.name}: {stats.summary()}")
+    elif tipo == 'error':
+        status_label.config(text=mensaje_error(*dato))
 
 def limpiar():
-    global last_photo_path, current_pil_image
-    if last_photo_path and os.path.exists(last_photo_path):
-        try:
-            os.remove(last_photo_path)
-        except Exception as e:
-            print(f"No se pudo borrar {last_photo_path}: {e}")
-    last_photo_path = None
-    current_pil_image = None
+    global current_frame
+    current_frame = None
 
     image_label.config(
         image=None,
@@ -270,16 +275,16 @@ def update_status_wraplength(event=None):
 
 def on_image_label_configure(event):
     """Se llama cuando image_label cambia de tamaño. Redibuja la imagen con debounce."""
-    global resize_job, current_pil_image
-    if current_pil_image:
+    global resize_job, current_frame
+    if current_frame:
         if resize_job:
             root.after_cancel(resize_job)
         resize_job = root.after(250, actual_image_resize_on_configure)
 
 def actual_image_resize_on_configure():
     """Realiza el redimensionamiento de la imagen."""
-    global current_pil_image
-    if not current_pil_image or not image_label.winfo_exists():
+    global current_frame
+    if not current_frame or not image_label.winfo_exists():
         return
 
     max_w = image_label.winfo_width() - 10
@@ -288,9 +293,7 @@ def actual_image_resize_on_configure():
     if max_w <= 10 or max_h <= 10:
         return
 
-    img_copy = current_pil_image.copy()
-    img_copy.thumbnail((max_w, max_h), Image.LANCZOS)
-    tk_img = ImageTk.PhotoImage(img_copy)
+    tk_img = ImageTk.PhotoImage(current_frame.preview((max_w, max_h)))
     image_label.config(image=tk_img)
     image_label.image = tk_img
 
@@ -302,4 +305,7 @@ image_label.bind("<Configure>", on_image_label_configure)
 root.update_idletasks()
 update_status_wraplength()
 
+# Eventos del trabajador de captura/clasificación
+worker.poll(root, on_worker_event)
+
 root.mainloop()
\ No newline at end of file
@@ -3,14 +3,10 @@ import tkinter.font as tkfont
 from PIL import Image, ImageTk
 import os
 from datetime import datetime
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
 import subprocess
+from trabajador_captura import load_default_classifier, staged_boot
 
 # --- Configuración modelo ---
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-class_names = ['R5', 'R6', 'R7', 'R8', 'R9', 'V1', 'V2', 'V3', 'V4']
 class_descriptions = {
     'R5': "Inicio de la floración; se observan las primeras flores abiertas.",
     'R6': "Floración plena; la mayoría de las plantas tienen flores.",
@@ -23,18 +19,6 @@ class_descriptions = {
     'V4': "Desarrollo del tercer par de hojas trifoliadas; la planta continúa acumulando biomasa"
 }
 
-model = models.googlenet(weights=None, aux_logits=False)
-model.fc = nn.Linear(model.fc.in_features, len(class_names))
-model.load_state_dict(torch.load('G19.pth', map_location=device))
-model.to(device)
-model.eval()
-
-transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
 
 # --- Interfaz Tkinter ---
 BASE_FONT_SIZE   = 20    # Tamaño base de fuente para textos generales
@@ -146,20 +130,6 @@ last_photo_path = None
 current_pil_image = None  # Para guardar la imagen PIL original para redimensionar
 resize_job = None         # Para el debounce del redimensionamiento de imagen
 
-def classify_image(path_or_pil_image):
-    if isinstance(path_or_pil_image, str):
-        img = Image.open(path_or_pil_image).convert('RGB')
-    elif isinstance(path_or_pil_image, Image.Image):
-        img = path_or_pil_image.convert('RGB')
-    else:
-        raise ValueError("Se espera una ruta de archivo o un objeto PIL.Image")
-
-    tensor = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        out = model(tensor)
-        _, pred = torch.max(out, 1)
-    return class_names[pred.item()]
-
 def display_image(pil_img_to_display):
     """Muestra una imagen PIL en image_label, redimensionándola."""
     global current_pil_image
@@ -298,4 +268,6 @@ image_label.bind("<Configure>", on_image_label_configure)
 root.update_idletasks()
 update_status_wraplength()
 
+# Arranque escalonado (ver trabajador_captura): la ventana aparece antes de cargar G19
+classify_image = staged_boot(root, load_default_classifier, status_label, capture_btn)
 root.mainloop()
\ No newline at end of file
@@ -3,27 +3,25 @@ from tkinter import font
 import os
 from datetime import datetime
 from PIL import Image, ImageTk
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
 import subprocess
+from trabajador_captura import staged_boot
 
 # --- Configuración modelo ---
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-class_names = ['clase0','clase1','clase2','clase3','clase4','clase5','clase6','clase7','clase8']
-model = models.resnet34(pretrained=False)
-model.fc = nn.Linear(model.fc.in_features, len(class_names))
-model.load_state_dict(torch.load('R23.pth', map_location=device))
-model.to(device)
-model.eval()
-
-# --- Transformación de imagen ---
-transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+def cargar_clasificador():
+    """Carga R23 con el backend pedido y hace el warm-up (en segundo plano, ver ``staged_boot``)."""
+    import torch
+    from motor_inferencia import InferenceEngine, OnnxRuntimeBackend, configure_from_args, load_model
+    from registro_modelos import REGISTRY
+    spec = REGISTRY['R23']  # arquitectura, checkpoint y etapas R5–R9, V1–V4 del registro
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    config = configure_from_args()  # ej: --backend onnx usa R23.onnx
+    model = load_model(spec.checkpoint, backend=config['backend'], build=spec.build)
+    if isinstance(model, OnnxRuntimeBackend):
+        device = torch.device('cpu')
+    engine = InferenceEngine(model, class_names=spec.class_names, transform=spec.transform, device=device,
+                             name=spec.name)
+    engine.warmup()
+    return engine.classify_image
 
 # --- Interfaz Tkinter ---
 BASE_FONT_SIZE = 12
@@ -99,14 +97,6 @@ root.update_idletasks()
 
 last_photo_path = None
 
-def classify_image(path):
-    img = Image.open(path).convert('RGB')
-    tensor = transform(img).unsqueeze(0).to(device)
-    with torch.no_grad():
-        out = model(tensor)
-        _, pred = torch.max(out,1)
-    return class_names[pred.item()]
-
 def tomar_y_clasificar():
     global last_photo_path
     status_label.config(text='Capturando imagen...')
@@ -152,4 +142,6 @@ def limpiar():
     capture_btn.config(state=tk.NORMAL)
     clear_btn.config(state=tk.DISABLED)
 
+# Arranque escalonado (ver trabajador_captura): la ventana aparece antes de cargar R23
+classify_image = staged_boot(root, cargar_clasificador, status_label, capture_btn)
 root.mainloop()
\ No newline at end of file
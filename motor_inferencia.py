@@ -0,0 +1,831 @@
+"""Motor de inferencia compartido para el clasificador de etapas de frijol.
+
+Reúne en un solo módulo la construcción del modelo G19 (GoogLeNet), la
+transformación de entrada y la clasificación, que antes estaba copiada en
+cada script. ``classify_batch`` apila N imágenes en un solo tensor y hace un
+único forward, en lugar de un forward por imagen.
+
+Si existe un artefacto TorchScript exportado con ``exportar_torchscript.py``
+cuyo hash coincide con el del checkpoint, ``load_model`` lo usa directamente y
+se salta la construcción de la red; si no, carga el modelo en modo eager.
+Con ``--precision int8`` se usa el modelo cuantizado por ``cuantizar_googlenet.py``;
+con ``--precision bf16`` el forward corre con autocast bfloat16 si supera la
+autoverificación contra fp32 (``check_reduced_precision``);
+y con ``--backend onnx`` el modelo exportado por ``exportar_onnx.py``, ejecutado
+con ONNX Runtime; todos reciben el mismo tensor preprocesado.
+Con ``--entrada uint8`` (o ``float01``) la normalización de ImageNet va plegada
+en la primera convolución y el modelo recibe directamente los píxeles.
+Con ``--tta fivecrop|tencrop`` cada imagen se clasifica promediando los
+logits de sus 5 recortes (esquinas y centro), o de esos y sus espejos, en el
+mismo forward del lote.
+
+Los checkpoints se cargan mapeados en memoria (``mmap``) directamente en un
+modelo sin pesos propios, así los pesos no se duplican durante la carga.
+
+Las imágenes se preprocesan en un buffer reutilizable (``preprocesamiento.py``),
+con el mismo resultado que ``transform`` pero sin sus tensores intermedios;
+``--preprocesamiento-clasico`` vuelve a ``transform`` imagen por imagen.
+
+Con ``--cache-resultados`` (tamaño) las probabilidades de cada imagen ya
+clasificada se guardan en una caché LRU indexada por el hash del contenido,
+el artefacto cargado y la transformación; ``--cache-persistente ruta`` la
+conserva entre reinicios. Solo el servidor y ``clasificar_carpeta.py`` la
+activan por defecto.
+
+Al arrancar se aplica el perfil del equipo escrito por ``autoajuste.py``
+(hilos de torch, backend, precisión y tamaño de lote); las opciones de la
+línea de comandos tienen prioridad sobre el perfil.
+"""
+import argparse
+import atexit
+import collections
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import threading
+import time
+from PIL import Image
+import torch
+import torch.nn as nn
+from torchvision import models, transforms
+
+try:
+    import onnxruntime
+except ImportError:  # ONNX Runtime es opcional: solo hace falta con --backend onnx
+    onnxruntime = None
+
+try:
+    from safetensors.torch import load_file as load_safetensors
+except ImportError:  # safetensors es opcional: solo hace falta para checkpoints .safetensors
+    load_safetensors = None
+
+from decodificacion import MODEL_SHORT_SIDE, as_rgb, open_for_model
+from optimizar_modelo import fold_conv_bn, fold_input_normalization, optimize_model
+from preprocesamiento import Preprocessor
+
+# --- Configuración modelo ---
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+class_names = ['R5', 'R6', 'R7', 'R8', 'R9', 'V1', 'V2', 'V3', 'V4']
+CHECKPOINT = 'G19.pth'
+PRECISIONS = ('fp32', 'int8', 'bf16')
+BACKENDS = ('eager', 'torchscript', 'onnx')
+TTA_MODES = ('off', 'fivecrop', 'tencrop')
+# Entrada del modelo: normalizada (ImageNet) o sin normalizar, con la normalización plegada en la primera conv
+INPUT_FORMATS = ('normalized', 'uint8', 'float01')
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Opciones de ejecución; los scripts las ajustan con configure_from_args()
+config = {
+    'precision': 'fp32',
+    'backend': 'torchscript',
+    'tta': 'off',
+    'input_format': 'normalized',
+    # Decodificar los JPEG directamente a la escala >= 256 que usa el modelo (Image.draft)
+    'scaled_decode': True,
+    # Preprocesar en un buffer reutilizable (preprocesamiento.py) en lugar de con transform imagen por imagen
+    'preallocated_preprocess': True,
+    # Autoverificación de bf16: imágenes de referencia y desacuerdo máximo tolerado con fp32
+    'calibration_dir': 'calibracion',
+    'max_disagreement': 0.02,
+    # None: el valor por defecto de torch (un hilo por núcleo)
+    'num_threads': None,
+    'num_interop_threads': None,
+    'batch_size': 8,
+    'profile_path': 'perfil_dispositivo.json',
+    # Modo cascada: confianza mínima del modelo rápido para no consultar a G19
+    'cascade_threshold': 0.9,
+    # Caché de resultados: número máximo de entradas (0 la desactiva) y archivo JSON opcional.
+    # Desactivada por defecto: en las interfaces cada captura es una foto nueva y nunca acierta;
+    # el servidor y clasificar_carpeta.py la activan con DEFAULT_RESULT_CACHE_SIZE
+    'result_cache_size': 0,
+    'result_cache_path': None,
+}
+DEFAULT_RESULT_CACHE_SIZE = 1024
+# Claves de config que puede fijar el perfil de autoajuste.py
+PROFILE_KEYS = ('backend', 'precision', 'num_threads', 'num_interop_threads', 'batch_size')
+
+transform = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(MEAN, STD)
+])
+# Transformación de cada formato de entrada; 'uint8' y 'float01' dejan la normalización al modelo
+INPUT_TRANSFORMS = {
+    'normalized': transform,
+    'uint8': transforms.Compose([transforms.Resize(256), transforms.CenterCrop(224), transforms.PILToTensor()]),
+    'float01': transforms.Compose([transforms.Resize(256), transforms.CenterCrop(224), transforms.ToTensor()]),
+}
+# Escala de los píxeles que recibe el modelo en cada formato sin normalizar
+INPUT_SCALES = {'uint8': 255.0, 'float01': 1.0}
+
+
+class MultiCropTransform:
+    """Variantes TTA de una imagen: tensor ``(V, 3, 224, 224)`` con los 5 recortes y, si ``flip``, sus espejos.
+
+    Usa el mismo Resize(256) y la misma conversión a tensor que ``base`` (por
+    defecto ``transform``); el recorte central es el mismo que el de ``base``.
+    """
+
+    def __init__(self, flip=True, base=transform):
+        self.flip = flip
+        self.resize = transforms.Resize(256)
+        self.five_crop = transforms.FiveCrop(224)
+        self.to_tensor = transforms.Compose(base.transforms[2:])  # ej. ToTensor + Normalize
+
+    def __repr__(self):
+        return f"MultiCropTransform(flip={self.flip})"
+
+    def __call__(self, img):
+        crops = torch.stack([self.to_tensor(c) for c in self.five_crop(self.resize(img))])
+        # Voltear el tensor ya convertido equivale a voltear la imagen y es más barato
+        return torch.cat([crops, crops.flip(-1)]) if self.flip else crops
+
+
+def build_model(num_classes=len(class_names)):
+    """Construye la GoogLeNet sin pesos con la capa fc de ``num_classes`` salidas."""
+    # init_weights=False: los pesos se sobrescriben con el checkpoint, no hace falta inicializarlos
+    model = models.googlenet(weights=None, aux_logits=False, init_weights=False)
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    return model
+
+
+def build_resnet34(num_classes=len(class_names)):
+    """Construye la ResNet34 sin pesos del checkpoint R23 con ``num_classes`` salidas."""
+    model = models.resnet34(weights=None)
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    return model
+
+
+def build_mobilenet_v3(num_classes=len(class_names)):
+    """Construye la MobileNetV3-Small sin pesos del clasificador rápido con ``num_classes`` salidas."""
+    model = models.mobilenet_v3_small(weights=None)
+    model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+    return model
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    """Hash SHA-256 (hex) del contenido de ``path``."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def torchscript_path(checkpoint, input_format='normalized'):
+    """Ruta del artefacto TorchScript asociado, ej: 'G19.pth' -> 'G19.ts' (o 'G19_uint8.ts')."""
+    suffix = '' if input_format == 'normalized' else f'_{input_format}'
+    return os.path.splitext(checkpoint)[0] + suffix + '.ts'
+
+
+def quantized_path(checkpoint):
+    """Ruta del modelo INT8 asociado, ej: 'G19.pth' -> 'G19_int8.ts'."""
+    return os.path.splitext(checkpoint)[0] + '_int8.ts'
+
+
+def onnx_path(checkpoint):
+    """Ruta del modelo ONNX asociado, ej: 'G19.pth' -> 'G19.onnx'."""
+    return os.path.splitext(checkpoint)[0] + '.onnx'
+
+
+class OnnxRuntimeBackend:
+    """Ejecuta un modelo ONNX con ONNX Runtime (CPU) con la misma interfaz que un nn.Module."""
+
+    def __init__(self, path, num_threads=None):
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.metadata = self.session.get_modelmeta().custom_metadata_map
+
+    def __call__(self, batch):
+        logits = self.session.run(None, {self.input_name: batch.detach().cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def load_onnx(artifact, checkpoint):
+    """Como ``load_torchscript``, pero para un modelo ONNX ejecutado con ONNX Runtime."""
+    if onnxruntime is None:
+        print("onnxruntime no está instalado, se usa PyTorch")
+        return None
+    if not os.path.exists(artifact):
+        return None
+    try:
+        backend = OnnxRuntimeBackend(artifact, config['num_threads'])
+    except Exception as e:
+        print(f"No se pudo cargar {artifact}, se usa PyTorch: {e}")
+        return None
+    if os.path.exists(checkpoint) and backend.metadata.get('checkpoint_sha256') != sha256_file(checkpoint):
+        print(f"{artifact} no corresponde a {checkpoint}, se usa PyTorch")
+        return None
+    return backend
+
+
+def load_torchscript(artifact, checkpoint, extra_files=None):
+    """Carga ``artifact`` si fue exportado desde este mismo ``checkpoint``.
+
+    Devuelve ``None`` si el artefacto no existe, no se puede leer o su hash no
+    coincide con el del checkpoint actual (artefacto desactualizado). Si el
+    checkpoint no está en el equipo, se confía en el artefacto. Los metadatos
+    pedidos en ``extra_files`` se rellenan en el mismo diccionario.
+    """
+    if not os.path.exists(artifact):
+        return None
+    if extra_files is None:
+        extra_files = {}
+    extra_files['checkpoint_sha256'] = ''
+    try:
+        module = torch.jit.load(artifact, map_location=device, _extra_files=extra_files)
+    except Exception as e:
+        print(f"No se pudo cargar {artifact}, se usa el modelo eager: {e}")
+        return None
+    if os.path.exists(checkpoint) and extra_files['checkpoint_sha256'].decode() != sha256_file(checkpoint):
+        print(f"{artifact} no corresponde a {checkpoint}, se usa el modelo eager")
+        return None
+    return module
+
+
+def load_state_dict(checkpoint, mmap=True):
+    """Lee los pesos de ``checkpoint`` mapeados en memoria, sin copiarlos a RAM.
+
+    Acepta los .pth de ``torch.save`` (formato zip) y .safetensors. Los .pth
+    en el formato antiguo no se pueden mapear y se leen completos; se pueden
+    convertir con ``convertir_checkpoint.py``. Con ``mmap=False`` se leen
+    completos a memoria propia del proceso.
+    """
+    if checkpoint.endswith('.safetensors'):
+        if load_safetensors is None:
+            raise RuntimeError(f"Para cargar {checkpoint} hace falta el paquete safetensors")
+        return load_safetensors(checkpoint, device=str(device))
+    if not mmap:
+        return torch.load(checkpoint, map_location=device, weights_only=True)
+    try:
+        return torch.load(checkpoint, map_location=device, mmap=True, weights_only=True)
+    except RuntimeError as e:
+        print(f"No se pudo mapear {checkpoint}, se carga completo: {e}")
+        return torch.load(checkpoint, map_location=device)
+
+
+def is_folded(state):
+    """``True`` si ``state`` ya tiene las BN plegadas en las convoluciones (``convertir_checkpoint.py``)."""
+    return not any(key.endswith('running_mean') for key in state)
+
+
+def load_eager(checkpoint=CHECKPOINT, build=build_model, state=None):
+    """Construye la red en el dispositivo 'meta' (sin memoria) y le asigna los pesos mapeados.
+
+    Si el checkpoint ya viene optimizado (BN plegadas, pesos en channels_last),
+    la red se pliega antes de asignarle los pesos, que se usan tal cual.
+    ``state`` permite pasar el state_dict ya leído.
+    """
+    if state is None:
+        state = load_state_dict(checkpoint)
+    with torch.device('meta'):
+        model = build()
+    model.eval()
+    if is_folded(state):
+        fold_conv_bn(model)  # en 'meta' solo cambia la estructura
+    model.load_state_dict(state, assign=True)
+    model.to(device)
+    return model
+
+
+def load_model(checkpoint=CHECKPOINT, backend='torchscript', precision='fp32', build=build_model,
+               optimize=True, input_format='normalized'):
+    """Carga ``checkpoint`` lista para inferencia con el ``backend`` pedido.
+
+    Devuelve un invocable que recibe un tensor NCHW normalizado y devuelve los
+    logits. Si el artefacto del backend no existe o está desactualizado se
+    recurre al TorchScript y, en último caso, al modelo eager que construye ``build``,
+    al que se aplica ``optimize_model`` (BN plegada y channels_last) si ``optimize``.
+
+    Con ``input_format`` 'uint8' o 'float01' el modelo recibe la imagen sin
+    normalizar (ver ``fold_input_normalization``); solo hay artefacto
+    TorchScript para ese caso (``exportar_torchscript.py --entrada``), si no
+    la normalización se pliega al cargar el modelo eager.
+    """
+    return load_model_artifact(checkpoint, backend, precision, build, optimize, input_format)[0]
+
+
+def load_model_artifact(checkpoint=CHECKPOINT, backend='torchscript', precision='fp32', build=build_model,
+                        optimize=True, input_format='normalized'):
+    """Como ``load_model``, pero devuelve ``(modelo, ruta)`` con el archivo que realmente se cargó.
+
+    Tras los retrocesos (ej. sin G19_int8.ts se usa fp32) la ruta dice qué
+    modelo da los resultados: .ts, _int8.ts, .onnx o el checkpoint (eager).
+    """
+    if input_format != 'normalized':
+        if backend != 'eager':
+            extra_files = {'input_format': ''}
+            path = torchscript_path(checkpoint, input_format)
+            module = load_torchscript(path, checkpoint, extra_files)
+            if module is not None and extra_files['input_format'].decode() == input_format:
+                return module, path
+        model = load_model(checkpoint, 'eager', 'fp32', build, optimize)
+        fold_input_normalization(model, MEAN, STD, INPUT_SCALES[input_format])
+        return model, checkpoint
+    if precision == 'int8':
+        extra_files = {'qengine': ''}
+        module = load_torchscript(quantized_path(checkpoint), checkpoint, extra_files)
+        if module is not None:
+            torch.backends.quantized.engine = extra_files['qengine'].decode()
+            return module, quantized_path(checkpoint)
+        print(f"No hay modelo INT8 válido para {checkpoint} (ver cuantizar_googlenet.py), se usa fp32")
+    if backend == 'onnx':
+        module = load_onnx(onnx_path(checkpoint), checkpoint)
+        if module is not None:
+            return module, onnx_path(checkpoint)
+    if backend in ('torchscript', 'onnx'):
+        module = load_torchscript(torchscript_path(checkpoint), checkpoint)
+        if module is not None:
+            return module, torchscript_path(checkpoint)
+    state = load_state_dict(checkpoint)
+    if is_folded(state) or not optimize:
+        return load_eager(checkpoint, build, state), checkpoint
+    # optimize_model copia cada convolución: con los pesos mapeados quedarían en RAM
+    # el mapeo y la copia a la vez, así que en ese caso se leen sin mmap
+    del state
+    model = load_eager(checkpoint, build, load_state_dict(checkpoint, mmap=False))
+    if not optimize_model(model):
+        model = load_eager(checkpoint, build)
+    return model, checkpoint
+
+
+def iter_image_paths(folder):
+    """Recorre ``folder`` recursivamente y produce las rutas de imágenes en orden."""
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def iter_labeled_images(folder):
+    """Produce ``(ruta, clase)`` de una carpeta con una subcarpeta por clase (ej. R5/, V1/)."""
+    for name in class_names:
+        class_dir = os.path.join(folder, name)
+        if os.path.isdir(class_dir):
+            for path in iter_image_paths(class_dir):
+                yield path, name
+
+
+def transform_paths(paths, transform=transform):
+    """Produce ``(ruta, tensor)`` de cada imagen legible de ``paths``; las ilegibles se anuncian y se omiten."""
+    for path in paths:
+        try:
+            tensor = transform(to_rgb(path))
+        except (OSError, ValueError) as e:  # archivo truncado o que no es una imagen
+            print(f"No se pudo leer {path}: {e}")
+            continue
+        yield path, tensor
+
+
+def resizes_to_model_side(t):
+    """``True`` si la transformación ``t`` empieza con ``Resize(256)`` (lado corto a 256)."""
+    first = t.transforms[0] if isinstance(t, transforms.Compose) else None
+    return isinstance(first, transforms.Resize) and first.size in (MODEL_SHORT_SIDE, [MODEL_SHORT_SIDE])
+
+
+class HashedImage:
+    """Imagen PIL ya decodificada junto con el SHA-256 de los bytes de los que salió.
+
+    Permite decodificar en otro hilo o proceso (``open_bytes``) y que el motor
+    use igualmente la caché por hash del archivo y el ``Preprocessor``.
+    """
+
+    __slots__ = ('image', 'sha256')
+
+    def __init__(self, image, sha256):
+        self.image = image
+        self.sha256 = sha256
+
+
+def open_bytes(data, scaled=False):
+    """``HashedImage`` de los bytes de un archivo de imagen; con ``scaled`` como ``to_rgb``."""
+    stream = io.BytesIO(data)
+    image = open_for_model(stream) if scaled else as_rgb(Image.open(stream))
+    return HashedImage(image, hashlib.sha256(data).hexdigest())
+
+
+def to_rgb(path_or_pil_image, scaled=False):
+    """Abre una ruta o convierte una imagen PIL (o ``HashedImage``) a RGB.
+
+    Con ``scaled`` una ruta JPEG se decodifica reducida, al menor tamaño con
+    lado corto >= 256; solo sirve si después se aplica ``Resize(256)``.
+    """
+    if isinstance(path_or_pil_image, str):
+        if scaled:
+            return open_for_model(path_or_pil_image)
+        return as_rgb(Image.open(path_or_pil_image))
+    if isinstance(path_or_pil_image, HashedImage):
+        return as_rgb(path_or_pil_image.image)
+    if isinstance(path_or_pil_image, Image.Image):
+        return as_rgb(path_or_pil_image)
+    raise ValueError("Se espera una ruta de archivo o un objeto PIL.Image")
+
+
+def content_hash(path_or_pil_image):
+    """SHA-256 del archivo (o de sus bytes, en ``HashedImage``), o de los píxeles (y modo y tamaño) de una imagen PIL."""
+    if isinstance(path_or_pil_image, str):
+        return sha256_file(path_or_pil_image)
+    if isinstance(path_or_pil_image, HashedImage):
+        return path_or_pil_image.sha256
+    h = hashlib.sha256(f"{path_or_pil_image.mode}{path_or_pil_image.size}".encode())
+    h.update(path_or_pil_image.tobytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Caché LRU (segura entre hilos) de probabilidades por imagen, modelo y transformación.
+
+    Guarda el vector softmax completo, así sirve para cualquier ``k``. Con
+    ``path`` se carga al crearla y ``save()`` la escribe en JSON.
+    """
+
+    def __init__(self, max_entries, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._entries.update(json.load(f))
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            probs = self._entries.get(key)
+            if probs is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return probs
+
+    def put(self, key, probs):
+        with self._lock:
+            self._entries[key] = probs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)  # atómico: un corte no deja el archivo a medias
+
+
+_result_cache = None
+
+
+def get_result_cache():
+    """Caché de resultados compartida por todos los motores (``None`` si está desactivada)."""
+    global _result_cache
+    if _result_cache is None and config['result_cache_size'] > 0:
+        _result_cache = ResultCache(config['result_cache_size'], config['result_cache_path'])
+        if config['result_cache_path']:
+            atexit.register(_result_cache.save)
+    return _result_cache
+
+
+class InferenceEngine:
+    """Clasifica lotes de imágenes con un modelo ya cargado.
+
+    ``model`` puede ser un módulo eager, un TorchScript o un ``OnnxRuntimeBackend``.
+    Si tiene ``result_cache`` y ``model_id`` (identifica los pesos y el
+    backend), las imágenes ya clasificadas no vuelven a pasar por el modelo.
+    """
+
+    def __init__(self, model, class_names=class_names, transform=transform, device=device, name=None,
+                 model_id=None, result_cache=None, input_format='normalized'):
+        self.name = name
+        self.model_id = model_id
+        self.result_cache = result_cache
+        self.model = model
+        self.class_names = class_names
+        self.transform = transform
+        self.device = device
+        # Entrada que espera el modelo (INPUT_FORMATS): la normalización puede ir plegada en él
+        self.input_format = input_format
+        # Los modelos de PyTorch rinden más con la entrada en channels_last; ONNX Runtime espera NCHW contiguo
+        self.memory_format = (torch.channels_last if isinstance(model, nn.Module)
+                              else torch.contiguous_format)
+        # dtype de autocast (ej. torch.bfloat16) o None para ejecutar en fp32
+        self.autocast_dtype = None
+        # MultiCropTransform para TTA, o None para un solo recorte central
+        self.tta_transform = None
+        # Las rutas JPEG se decodifican reducidas si la transformación empieza con Resize(256)
+        self.scaled_decode = config['scaled_decode'] and resizes_to_model_side(transform)
+        # Escribe el lote directamente en un buffer preasignado si sabe reproducir la transformación
+        self.preprocessor = (Preprocessor.for_transform(transform, self.memory_format)
+                             if config['preallocated_preprocess'] else None)
+
+    def preprocess(self, images):
+        """Apila rutas, imágenes PIL o tensores ya transformados en un tensor NCHW.
+
+        Si no hay tensores entre ``images`` y hay ``preprocessor``, el lote es
+        una vista de su buffer, válida hasta el siguiente lote de este hilo.
+        """
+        if self.preprocessor is not None and not any(isinstance(img, torch.Tensor) for img in images):
+            batch = self.preprocessor.buffer(len(images))
+            for slot, img in zip(batch, images):
+                self.preprocessor.fill(slot, to_rgb(img, self.scaled_decode))
+            return batch.to(self.device)
+        tensors = [img if isinstance(img, torch.Tensor) else self.transform(to_rgb(img, self.scaled_decode))
+                   for img in images]
+        return torch.stack(tensors).to(self.device).contiguous(memory_format=self.memory_format)
+
+    def preprocess_tta(self, images):
+        """Como ``preprocess``, pero con todas las variantes TTA de cada imagen en el mismo lote.
+
+        Devuelve ``(batch, counts)``: ``counts[i]`` es el número de variantes de
+        la imagen ``i``. Los tensores ya transformados (3 dimensiones) cuentan
+        como una sola variante.
+        """
+        variants = [(img if img.dim() == 4 else img.unsqueeze(0)) if isinstance(img, torch.Tensor)
+                    else self.tta_transform(to_rgb(img, self.scaled_decode)) for img in images]
+        batch = torch.cat(variants).to(self.device).contiguous(memory_format=self.memory_format)
+        return batch, [len(v) for v in variants]
+
+    def forward(self, batch):
+        """Logits en fp32 de un lote ya preprocesado, con autocast si está activo."""
+        if self.autocast_dtype is None:
+            return self.model(batch)
+        with torch.autocast(self.device.type, dtype=self.autocast_dtype):
+            return self.model(batch).float()
+
+    def classify_batch(self, images, k=1):
+        """Clasifica ``images`` en un solo forward (incluidas las variantes TTA, si está activo).
+
+        Las imágenes que ya están en la caché de resultados no pasan por el modelo.
+
+        Devuelve ``(labels, probabilities)``: ``labels`` es una lista con las
+        ``k`` etiquetas más probables de cada imagen y ``probabilities`` un
+        tensor ``(N, k)`` con sus probabilidades softmax.
+        """
+        if len(images) == 0:
+            return [], torch.empty(0, k)
+        keys = self.cache_keys(images)
+        cached = [None if key is None else self.result_cache.get(key) for key in keys]
+        misses = [i for i, probs in enumerate(cached) if probs is None]
+        probs = torch.empty(len(images), len(self.class_names))
+        if misses:
+            probs[misses] = self.probabilities([images[i] for i in misses])
+        for i, row in enumerate(cached):
+            if row is not None:
+                probs[i] = torch.tensor(row)
+            elif keys[i] is not None:
+                self.result_cache.put(keys[i], probs[i].tolist())
+        probs, idx = probs.topk(k, dim=1)
+        labels = [[self.class_names[i] for i in row] for row in idx.tolist()]
+        return labels, probs
+
+    def probabilities(self, images):
+        """Probabilidades softmax ``(N, clases)`` de ``images``, en un solo forward."""
+        if self.tta_transform is None:
+            batch, counts = self.preprocess(images), None
+        else:
+            batch, counts = self.preprocess_tta(images)
+        with torch.inference_mode():
+            logits = self.forward(batch)
+            if counts is not None:  # promedio de los logits de las variantes de cada imagen
+                logits = torch.stack([v.mean(0) for v in logits.split(counts)])
+            return torch.softmax(logits, dim=1).float().cpu()
+
+    def cache_keys(self, images):
+        """Clave de caché de cada imagen, o ``None`` si no se cachea (tensores, o motor sin caché)."""
+        if self.result_cache is None or self.model_id is None:
+            return [None] * len(images)
+        # La precisión (autocast), el formato de entrada, la decodificación reducida y el TTA
+        # cambian el resultado, así que forman parte de la clave
+        setup = (f"{self.model_id}|{self.autocast_dtype}|{self.input_format}|{self.scaled_decode}|"
+                 f"{self.transform!r}|{self.tta_transform!r}")
+        setup = hashlib.sha256(setup.encode()).hexdigest()[:16]
+        return [None if isinstance(img, torch.Tensor) else f"{content_hash(img)}:{setup}" for img in images]
+
+    def classify_image(self, path_or_pil_image):
+        """Clasifica una sola imagen y devuelve el nombre de la clase, ej: 'R5'."""
+        labels, _ = self.classify_batch([path_or_pil_image])
+        return labels[0][0]
+
+    def warmup(self, batch_size=1):
+        """Forward con un tensor de ceros para que la primera captura no pague la inicialización."""
+        self.classify_batch([torch.zeros(3, 224, 224)] * batch_size)
+
+
+def device_id():
+    """Identifica el modelo de placa (ej. 'Raspberry Pi 4 Model B Rev 1.5') para elegir su perfil."""
+    try:
+        with open('/proc/device-tree/model') as f:
+            return f.read().rstrip('\x00').strip()
+    except OSError:  # no es una placa con device tree (ej. un PC)
+        return f"{platform.machine()} {os.cpu_count()} CPU"
+
+
+def load_device_profile(path):
+    """Devuelve el perfil de este equipo guardado en ``path``, o ``None`` si no lo hay."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(device_id())
+
+
+def set_threads(num_threads=None, num_interop_threads=None):
+    """Fija los hilos de torch; ``None`` deja el valor por defecto."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:  # solo se puede fijar una vez y antes de usar el pool de hilos
+            print(f"No se pudo fijar num_interop_threads={num_interop_threads}: {e}")
+
+
+_profile_applied = False
+
+
+def apply_device_profile(path=None):
+    """Aplica una sola vez el perfil de este equipo (si existe) a ``config`` y a torch."""
+    global _profile_applied
+    if _profile_applied:
+        return config
+    _profile_applied = True
+    profile = load_device_profile(path or config['profile_path'])
+    if profile is not None:
+        config.update({k: profile[k] for k in PROFILE_KEYS if k in profile})
+        print(f"Perfil de {device_id()}: " + ', '.join(f"{k}={config[k]}" for k in PROFILE_KEYS))
+    set_threads(config['num_threads'], config['num_interop_threads'])
+    return config
+
+
+def configure_from_args(argv=None):
+    """Lee las opciones de ejecución (ej. ``--precision int8``) de la línea de comandos.
+
+    Primero aplica el perfil del equipo (``--perfil``, por defecto
+    perfil_dispositivo.json) y luego las opciones dadas explícitamente.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--precision', choices=PRECISIONS, default=None)
+    parser.add_argument('--backend', choices=BACKENDS, default=None)
+    parser.add_argument('--hilos', type=int, default=None)
+    parser.add_argument('--tta', choices=TTA_MODES, default=None)
+    parser.add_argument('--entrada', choices=INPUT_FORMATS, default=None,
+                        help="uint8/float01: el modelo recibe la imagen sin normalizar")
+    parser.add_argument('--decodificacion-completa', action='store_true',
+                        help="decodificar los JPEG a tamaño completo")
+    parser.add_argument('--preprocesamiento-clasico', action='store_true',
+                        help="preprocesar con transform imagen por imagen, sin buffer reutilizable")
+    parser.add_argument('--perfil', default=None)
+    parser.add_argument('--umbral-cascada', type=float, default=None)
+    parser.add_argument('--cache-resultados', type=int, default=None, help="entradas de la caché (0 la desactiva)")
+    parser.add_argument('--cache-persistente', default=None, help="archivo JSON para conservar la caché")
+    args, _ = parser.parse_known_args(argv)
+    apply_device_profile(args.perfil)
+    if args.precision:
+        config['precision'] = args.precision
+    if args.backend:
+        config['backend'] = args.backend
+    if args.hilos:
+        config['num_threads'] = args.hilos
+        set_threads(args.hilos)
+    if args.tta:
+        config['tta'] = args.tta
+    if args.entrada:
+        config['input_format'] = args.entrada
+    if args.decodificacion_completa:
+        config['scaled_decode'] = False
+    if args.preprocesamiento_clasico:
+        config['preallocated_preprocess'] = False
+    if args.umbral_cascada is not None:
+        config['cascade_threshold'] = args.umbral_cascada
+    if args.cache_resultados is not None:
+        config['result_cache_size'] = args.cache_resultados
+    if args.cache_persistente:
+        config['result_cache_path'] = args.cache_persistente
+    return config
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Devuelve el motor por defecto (G19), cargándolo la primera vez (seguro entre hilos)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine()
+    return _engine
+
+
+def calibration_batch(folder, max_images=16, transform=transform):
+    """Lote de referencia para la autoverificación con imágenes reales de ``folder``, o ``None`` si no hay."""
+    if not os.path.isdir(folder):
+        return None
+    tensors = [t for _, t in itertools.islice(transform_paths(iter_image_paths(folder), transform), max_images)]
+    return torch.stack(tensors) if tensors else None
+
+
+def check_reduced_precision(engine, dtype, batch, max_disagreement):
+    """Compara ``engine`` en fp32 y con autocast ``dtype`` sobre ``batch``.
+
+    Devuelve ``(ok, motivo)``: ``ok`` es ``False`` si el dtype no está
+    soportado, si la fracción de predicciones distintas supera
+    ``max_disagreement`` o si resulta más lento que fp32 (sin soporte nativo
+    en la CPU el bfloat16 se emula).
+    """
+    batch = batch.to(engine.device).contiguous(memory_format=engine.memory_format)
+
+    def timed_forward():
+        with torch.inference_mode():
+            engine.forward(batch)  # warm-up
+            start = time.perf_counter()
+            logits = engine.forward(batch)
+        return logits.argmax(1), time.perf_counter() - start
+
+    engine.autocast_dtype = None
+    preds_fp32, time_fp32 = timed_forward()
+    engine.autocast_dtype = dtype
+    try:
+        preds_reduced, time_reduced = timed_forward()
+    except RuntimeError as e:
+        return False, f"no soportado: {e}"
+    finally:
+        engine.autocast_dtype = None
+    disagreement = (preds_fp32 != preds_reduced).float().mean().item()
+    if disagreement > max_disagreement:
+        return False, f"desacuerdo con fp32 de {disagreement:.1%} (máximo {max_disagreement:.1%})"
+    if time_reduced >= time_fp32:
+        return False, f"más lento que fp32 ({time_reduced * 1000:.0f} vs {time_fp32 * 1000:.0f} ms)"
+    return True, f"desacuerdo {disagreement:.1%}, {time_fp32 / time_reduced:.2f}x más rápido"
+
+
+def create_engine(checkpoint=CHECKPOINT, build=build_model, class_names=class_names,
+                  transform=transform, name='G19'):
+    """Carga ``checkpoint`` con el backend y la precisión de ``config`` y lo envuelve en un motor."""
+    apply_device_profile()
+    precision = config['precision']
+    input_format = config['input_format']
+    if input_format != 'normalized' and (precision == 'int8' or config['backend'] == 'onnx'
+                                         or transform is not INPUT_TRANSFORMS['normalized']):
+        print(f"La entrada {input_format} solo está disponible con PyTorch en fp32/bf16 y la transformación "
+              f"estándar, se usa la entrada normalizada")
+        input_format = 'normalized'
+    transform = INPUT_TRANSFORMS[input_format] if input_format != 'normalized' else transform
+    # Los modelos cuantizados solo se ejecutan en CPU
+    engine_device = torch.device('cpu') if precision == 'int8' else device
+    model, artifact = load_model_artifact(checkpoint, backend=config['backend'], precision=precision, build=build,
+                                          input_format=input_format)
+    if isinstance(model, OnnxRuntimeBackend):
+        engine_device = torch.device('cpu')
+    result_cache = get_result_cache()
+    model_id = None
+    if result_cache is not None:
+        # El archivo que se cargó de verdad (tras los retrocesos) y su contenido: un INT8 recalibrado
+        # o un TorchScript reexportado tienen otro hash y no comparten resultados
+        weights = sha256_file(artifact) if os.path.exists(artifact) else 'sin-checkpoint'
+        model_id = f"{name}:{os.path.basename(artifact)}:{weights}:{type(model).__name__}"
+    engine = InferenceEngine(model, class_names, transform, engine_device, name=name,
+                             model_id=model_id, result_cache=result_cache, input_format=input_format)
+    if config['tta'] != 'off':
+        engine.tta_transform = MultiCropTransform(flip=config['tta'] == 'tencrop', base=transform)
+    if precision == 'bf16':
+        if isinstance(model, OnnxRuntimeBackend):
+            print("bf16 no aplica al backend onnx, se usa fp32")
+            return engine
+        batch = calibration_batch(config['calibration_dir'], transform=transform)
+        if batch is None:
+            # Sobre ruido el desacuerdo con fp32 no dice nada de las fotos reales
+            print(f"bf16 descartado, se usa fp32: no hay imágenes de calibración en {config['calibration_dir']}")
+            return engine
+        ok, motivo = check_reduced_precision(engine, torch.bfloat16, batch, config['max_disagreement'])
+        print(f"bf16 {'activado' if ok else 'descartado, se usa fp32'}: {motivo}")
+        if ok:
+            engine.autocast_dtype = torch.bfloat16
+    return engine
+
+
+def classify_batch(images, k=1):
+    return get_engine().classify_batch(images, k)
+
+
+def classify_image(path_or_pil_image):
+    return get_engine().classify_image(path_or_pil_image)
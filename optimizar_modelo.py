@@ -0,0 +1,131 @@
+"""Optimizaciones de carga para modelos eager: plegado conv+BN, formato channels_last y normalización.
+
+Tras ``model.eval()`` cada BasicConv2d de GoogLeNet sigue ejecutando la
+convolución y la BatchNorm por separado. ``optimize_model`` pliega cada BN en
+los pesos y el sesgo de la convolución que la precede, pasa el modelo a
+``channels_last`` (más rápido con los kernels de CPU) y verifica que los logits
+no se alejan del modelo original. Trabaja en el mismo modelo, sin copiarlo,
+para no duplicar los pesos en memoria; si la verificación falla, quien llama
+debe volver a cargar el checkpoint sin optimizar.
+
+``fold_input_normalization`` pliega además la normalización de ImageNet en la
+primera convolución, para que el modelo reciba directamente los píxeles uint8
+(o en 0–1) y la entrada no tenga que normalizarse aparte.
+"""
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+def fold_conv_bn(model):
+    """Pliega en su lugar cada BatchNorm2d registrada justo después de una Conv2d.
+
+    Cubre BasicConv2d de GoogLeNet (conv, bn), los bloques de ResNet (conv1,
+    bn1, ...) y los ``downsample`` Sequential(conv, bn). La BN plegada se
+    reemplaza por ``nn.Identity``. Devuelve el número de pares plegados.
+    """
+    folded = 0
+    for parent in model.modules():
+        names = list(parent._modules)
+        for conv_name, bn_name in zip(names, names[1:]):
+            conv = parent._modules[conv_name]
+            bn = parent._modules[bn_name]
+            if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                parent._modules[conv_name] = fuse_conv_bn_eval(conv, bn)
+                parent._modules[bn_name] = nn.Identity()
+                folded += 1
+    return folded
+
+
+def optimize_model(model, tolerance=1e-3, input_size=(2, 3, 224, 224)):
+    """Optimiza ``model`` (en eval) en su lugar.
+
+    Devuelve ``True`` si los logits siguen a menos de ``tolerance`` de los del
+    modelo sin optimizar; ``False`` si no, y en ese caso el modelo ya no es
+    utilizable.
+    """
+    device = next(model.parameters()).device
+    generator = torch.Generator().manual_seed(0)
+    example = torch.randn(input_size, generator=generator).to(device)
+    with torch.inference_mode():
+        reference = model(example)
+
+    fold_conv_bn(model)
+    model.to(memory_format=torch.channels_last)
+    with torch.inference_mode():
+        optimized = model(example.contiguous(memory_format=torch.channels_last))
+    diff = (optimized - reference).abs().max().item()
+    if diff > tolerance:
+        print(f"Optimización descartada: los logits difieren {diff:.2e} (> {tolerance:.0e})")
+        return False
+    return True
+
+
+class NormalizedInputConv(nn.Module):
+    """Primera convolución con ``(x / input_scale - mean) / std`` plegado en sus pesos y su sesgo.
+
+    El relleno con ceros de la convolución original equivale a rellenar la
+    imagen sin normalizar con la media; como aquí la entrada llega sin
+    normalizar, la diferencia se precalcula para ``input_size`` y se suma solo
+    en las filas y columnas del borde de la salida, las únicas que tocan el
+    relleno. Acepta uint8 (se convierte a float dentro del modelo) o float.
+    """
+
+    def __init__(self, conv, mean, std, input_scale=255.0, input_size=(224, 224)):
+        super().__init__()
+        mean = torch.as_tensor(mean, dtype=conv.weight.dtype, device=conv.weight.device)
+        std = torch.as_tensor(std, dtype=conv.weight.dtype, device=conv.weight.device)
+        weight = conv.weight.detach()
+        bias = conv.bias.detach() if conv.bias is not None else torch.zeros(conv.out_channels, device=weight.device)
+        self.conv = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size, conv.stride, conv.padding,
+                              conv.dilation, conv.groups, bias=True, device=weight.device)
+        with torch.no_grad():
+            self.conv.weight.copy_(weight / (std * input_scale)[None, :, None, None])
+            self.conv.bias.copy_(bias - (weight * (mean / std)[None, :, None, None]).sum((1, 2, 3)))
+            # Aporte del relleno: la media normalizada en el borde, sin nada en el interior
+            (ph, pw), (kh, kw) = conv.padding, conv.kernel_size
+            border = (mean / std)[None, :, None, None].expand(1, -1, input_size[0] + 2 * ph,
+                                                             input_size[1] + 2 * pw).clone()
+            border[:, :, ph:ph + input_size[0], pw:pw + input_size[1]] = 0
+            correction = nn.functional.conv2d(border, weight, None, conv.stride, 0, conv.dilation, conv.groups)
+        self.rows = self._border_span(input_size[0], kh, conv.stride[0], ph, conv.dilation[0])
+        self.cols = self._border_span(input_size[1], kw, conv.stride[1], pw, conv.dilation[1])
+        self.register_buffer('correction', correction)
+
+    @staticmethod
+    def _border_span(size, kernel, stride, padding, dilation):
+        """``(antes, después)``: salidas al principio y al final cuya ventana cae en el relleno."""
+        outputs = (size + 2 * padding - dilation * (kernel - 1) - 1) // stride + 1
+        before = sum(1 for i in range(outputs) if i * stride - padding < 0)
+        after = sum(1 for i in range(outputs) if i * stride - padding + dilation * (kernel - 1) > size - 1)
+        return before, outputs - after
+
+    def forward(self, x):
+        y = self.conv(x.float())
+        (top, bottom), (left, right) = self.rows, self.cols
+        c = self.correction
+        y[:, :, :top] += c[:, :, :top]
+        y[:, :, bottom:] += c[:, :, bottom:]
+        y[:, :, top:bottom, :left] += c[:, :, top:bottom, :left]
+        y[:, :, top:bottom, right:] += c[:, :, top:bottom, right:]
+        return y
+
+
+def fold_input_normalization(model, mean, std, input_scale=255.0, input_size=(224, 224)):
+    """Reemplaza en su lugar la primera Conv2d de ``model`` por una ``NormalizedInputConv``.
+
+    Después ``model`` recibe la imagen sin normalizar: uint8 en 0–255 con
+    ``input_scale=255`` o float en 0–1 con ``input_scale=1``. Conviene llamarla
+    después de ``optimize_model``, que ya no reconoce la convolución plegada.
+    """
+    name, conv = next(((n, m) for n, m in model.named_modules() if isinstance(m, nn.Conv2d)), (None, None))
+    if conv is None:
+        raise ValueError("El modelo no tiene ninguna Conv2d")
+    if conv.in_channels != 3 or conv.groups != 1:
+        raise ValueError(f"La primera convolución ({name}) no recibe la imagen RGB")
+    folded = NormalizedInputConv(conv, mean, std, input_scale, input_size)
+    if conv.weight.is_contiguous(memory_format=torch.channels_last):
+        folded.to(memory_format=torch.channels_last)
+    parent_name, _, attr = name.rpartition('.')
+    setattr(model.get_submodule(parent_name), attr, folded)
+    return folded
@@ -0,0 +1,167 @@
+"""Perfil por bloque de G19: tiempo, FLOPs estimados y memoria de activaciones.
+
+Uso:
+    python perfilar_bloques.py [--modelo G19] [--repeticiones 20] [--lote 1] [--sin-optimizar]
+                               [--json perfil_bloques.json]
+
+Registra hooks de forward en cada bloque de primer nivel del modelo eager
+(en GoogLeNet: conv1–conv3, los maxpool, inception3a…inception5b, avgpool,
+dropout y fc) y, durante ``--repeticiones`` forwards, mide el tiempo de
+pared de cada bloque. Las FLOPs se estiman a partir de las convoluciones y
+capas lineales que contiene el bloque (2 × multiplicaciones-acumulaciones);
+la memoria es el tamaño del tensor de salida del bloque y la suma de las
+salidas intermedias de sus capas, contando una sola vez cada almacenamiento
+(las ReLU in-place, el Dropout en eval y las ``nn.Identity`` que deja el
+plegado de BN devuelven el mismo tensor que reciben). Imprime los bloques ordenados por tiempo,
+para decidir dónde conviene podar o cuantizar primero.
+
+Por defecto perfila el modelo como lo carga la aplicación (BN plegada y
+channels_last); ``--sin-optimizar`` usa el modelo tal como sale del checkpoint.
+"""
+import argparse
+import json
+import time
+import torch
+import torch.nn as nn
+from motor_inferencia import device, load_model
+
+
+def layer_flops(module, inputs, output):
+    """FLOPs (2 × MACs) de una Conv2d o Linear para la entrada/salida dadas; 0 para otras capas."""
+    if isinstance(module, nn.Conv2d):
+        kh, kw = module.kernel_size
+        macs = output.numel() * (module.in_channels // module.groups) * kh * kw
+        return 2 * macs
+    if isinstance(module, nn.Linear):
+        return 2 * output.numel() * module.in_features
+    return 0
+
+
+class BlockProfiler:
+    """Hooks de forward que acumulan tiempo, FLOPs y memoria por bloque de ``model``."""
+
+    def __init__(self, model):
+        self.blocks = [name for name, _ in model.named_children()]
+        self.times = {name: [] for name in self.blocks}
+        self.flops = dict.fromkeys(self.blocks, 0)
+        self.output_bytes = dict.fromkeys(self.blocks, 0)
+        self.intermediate_bytes = dict.fromkeys(self.blocks, 0)
+        self._start = {}
+        self._first_run = True
+        # Salidas ya contadas en el primer forward: se conservan para que el asignador
+        # no reutilice su memoria y otra salida distinta no parezca ya contada
+        self._counted = {name: {} for name in self.blocks}
+        self._handles = []
+        sync = torch.cuda.synchronize if device.type == 'cuda' else (lambda: None)
+
+        for name, block in model.named_children():
+            def pre_hook(module, inputs, name=name):
+                if self._first_run and inputs and isinstance(inputs[0], torch.Tensor):
+                    # La entrada ya es memoria del bloque anterior: si una capa la devuelve, no cuenta
+                    self._counted[name][inputs[0].untyped_storage().data_ptr()] = inputs[0]
+                sync()
+                self._start[name] = time.perf_counter()
+
+            def post_hook(module, inputs, output, name=name):
+                sync()
+                self.times[name].append((time.perf_counter() - self._start[name]) * 1000)
+                if self._first_run:
+                    self.output_bytes[name] = output.numel() * output.element_size()
+
+            self._handles.append(block.register_forward_pre_hook(pre_hook))
+            self._handles.append(block.register_forward_hook(post_hook))
+            # Las capas internas solo se cuentan en el primer forward: FLOPs y memoria no cambian
+            for layer in block.modules():
+                if next(layer.children(), None) is not None or isinstance(layer, nn.Identity):
+                    continue  # solo capas hoja que calculan algo
+
+                def layer_hook(module, inputs, output, name=name):
+                    if self._first_run and isinstance(output, torch.Tensor):
+                        self.flops[name] += layer_flops(module, inputs, output)
+                        storage = output.untyped_storage()
+                        if storage.data_ptr() not in self._counted[name]:
+                            self._counted[name][storage.data_ptr()] = output
+                            self.intermediate_bytes[name] += storage.nbytes()
+
+                self._handles.append(layer.register_forward_hook(layer_hook))
+
+    def end_run(self):
+        self._first_run = False
+        self._counted = None
+
+    def remove(self):
+        for handle in self._handles:
+            handle.remove()
+
+    def report(self):
+        """Filas por bloque ordenadas de mayor a menor tiempo medio."""
+        total = sum(sum(v) / len(v) for v in self.times.values() if v)
+        rows = []
+        for name in self.blocks:
+            times = sorted(self.times[name])
+            if not times:
+                continue
+            mean = sum(times) / len(times)
+            rows.append({
+                'bloque': name,
+                'ms_media': round(mean, 3),
+                'ms_p50': round(times[len(times) // 2], 3),
+                'porcentaje': round(100 * mean / total, 1) if total else 0.0,
+                'mflops': round(self.flops[name] / 1e6, 2),
+                'gflops_s': round(self.flops[name] / 1e6 / mean, 2) if mean else 0.0,
+                'salida_kib': round(self.output_bytes[name] / 1024, 1),
+                'intermedias_kib': round(self.intermediate_bytes[name] / 1024, 1),
+            })
+        return sorted(rows, key=lambda r: r['ms_media'], reverse=True)
+
+
+def profile(model, repeticiones=20, batch_size=1, memory_format=torch.channels_last):
+    """Ejecuta ``repeticiones`` forwards con hooks (tras un warm-up sin ellos) y devuelve el reporte."""
+    x = torch.randn(batch_size, 3, 224, 224).to(device).contiguous(memory_format=memory_format)
+    with torch.inference_mode():
+        model(x)  # warm-up
+        profiler = BlockProfiler(model)
+        try:
+            for _ in range(repeticiones):
+                model(x)
+                profiler.end_run()
+        finally:
+            profiler.remove()
+    return profiler.report()
+
+
+def main():
+    from registro_modelos import REGISTRY
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modelo', default='G19', choices=[n for n, spec in REGISTRY.items() if spec.build])
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--lote', type=int, default=1)
+    parser.add_argument('--sin-optimizar', action='store_true', help="sin plegar BN ni channels_last")
+    parser.add_argument('--json', default=None, help="guardar el reporte en este archivo")
+    args = parser.parse_args()
+
+    spec = REGISTRY[args.modelo]
+    model = load_model(spec.checkpoint, backend='eager', build=spec.build, optimize=not args.sin_optimizar)
+    first_conv = next(m for m in model.modules() if isinstance(m, nn.Conv2d))
+    memory_format = (torch.channels_last if first_conv.weight.is_contiguous(memory_format=torch.channels_last)
+                     else torch.contiguous_format)
+    rows = profile(model, args.repeticiones, args.lote, memory_format)
+
+    total_ms = sum(r['ms_media'] for r in rows)
+    total_mflops = sum(r['mflops'] for r in rows)
+    print(f"{spec.name}, lote {args.lote}, {args.repeticiones} repeticiones: "
+          f"{total_ms:.1f} ms, {total_mflops / 1000:.2f} GFLOPs por forward")
+    print(f"{'bloque':12s} {'ms':>8s} {'%':>6s} {'MFLOPs':>9s} {'GFLOP/s':>8s} {'salida KiB':>11s} {'interm. KiB':>12s}")
+    for r in rows:
+        print(f"{r['bloque']:12s} {r['ms_media']:8.2f} {r['porcentaje']:6.1f} {r['mflops']:9.1f} "
+              f"{r['gflops_s']:8.2f} {r['salida_kib']:11.1f} {r['intermedias_kib']:12.1f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'modelo': spec.name, 'lote': args.lote, 'repeticiones': args.repeticiones,
+                       'bloques': rows}, f, indent=2, ensure_ascii=False)
+        print(f"Reporte guardado en {args.json}")
+
+
+if __name__ == '__main__':
+    main()
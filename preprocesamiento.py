@@ -0,0 +1,177 @@
+"""Preprocesamiento en un buffer preasignado, idéntico bit a bit a ``transform``.
+
+Uso (verificación y medición):
+    python preprocesamiento.py [--fotos fotos_campo] [--lote 8] [--repeticiones 20]
+
+``transform`` (Resize(256) + CenterCrop(224) + ToTensor + Normalize) crea por
+imagen la imagen recortada, un tensor uint8, un tensor float y otro
+normalizado; en equipos de 1 GB ese ir y venir de memoria se nota como
+pausas. ``Preprocessor`` hace el mismo Resize con PIL, toma el recorte
+central como una vista NumPy sin copiarlo y escribe cada canal directamente
+en un buffer float NCHW (o channels_last) que se reutiliza entre llamadas.
+
+La conversión a float y la normalización van en un solo paso: con píxeles
+uint8 solo hay 256 valores posibles por canal, así que se precalcula
+``(v / 255 - media) / desviación`` para cada uno con las mismas operaciones
+float32 que ToTensor y Normalize, y cada canal se resuelve con una tabla de
+búsqueda (``np.take``). El resultado es idéntico bit a bit a ``transform``.
+Para los modelos que reciben la imagen sin normalizar (``--entrada uint8`` o
+``float01`` en ``motor_inferencia``) hace lo mismo con las transformaciones
+de ``INPUT_TRANSFORMS``; en uint8 solo copia los píxeles del recorte.
+"""
+import argparse
+import itertools
+import threading
+import time
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+import torchvision.transforms.functional as F
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def normalization_lut(mean=MEAN, std=STD):
+    """Tabla ``(3, 256)`` float32 con el valor normalizado de cada nivel de gris de cada canal."""
+    levels = torch.arange(256, dtype=torch.uint8).to(torch.float32).div(255)  # como ToTensor
+    mean = torch.as_tensor(mean, dtype=torch.float32)[:, None]
+    std = torch.as_tensor(std, dtype=torch.float32)[:, None]
+    return levels[None, :].sub(mean).div(std).numpy()  # como Normalize
+
+
+def parse_transform(t):
+    """``(resize, crop, dtype, mean, std)`` de una transformación que ``Preprocessor`` sabe reproducir, o ``None``.
+
+    Reconoce ``Resize(n)`` + ``CenterCrop(m)`` seguidos de ``ToTensor`` +
+    ``Normalize``, solo ``ToTensor`` (0–1) o ``PILToTensor`` (uint8), con las
+    opciones por defecto. Con imágenes PIL ``antialias`` no importa: PIL
+    siempre filtra al reducir.
+    """
+    steps = t.transforms if isinstance(t, transforms.Compose) else []
+    if [type(s) for s in steps[:2]] != [transforms.Resize, transforms.CenterCrop]:
+        return None
+    resize, crop = steps[:2]
+    if not (isinstance(resize.size, int) or len(resize.size) == 1):
+        return None
+    size = resize.size if isinstance(resize.size, int) else resize.size[0]
+    # Con el lado corto >= recorte, CenterCrop nunca necesita rellenar
+    if (resize.interpolation != F.InterpolationMode.BILINEAR or resize.max_size is not None
+            or not crop.size[0] == crop.size[1] <= size):
+        return None
+    tail = [type(s) for s in steps[2:]]
+    if tail == [transforms.ToTensor, transforms.Normalize] and not steps[3].inplace:
+        return size, crop.size[0], torch.float32, steps[3].mean, steps[3].std
+    if tail == [transforms.ToTensor]:
+        return size, crop.size[0], torch.float32, (0.0, 0.0, 0.0), (1.0, 1.0, 1.0)
+    if tail == [transforms.PILToTensor]:
+        return size, crop.size[0], torch.uint8, None, None
+    return None
+
+
+class Preprocessor:
+    """Reemplazo de ``transform`` para lotes que escribe en un buffer preasignado.
+
+    ``images`` son imágenes PIL en RGB. El tensor devuelto es una vista del
+    buffer y queda válido hasta la siguiente llamada desde el mismo hilo;
+    cada hilo tiene su propio buffer. Con ``dtype=torch.uint8`` se copian los
+    píxeles tal cual, para modelos con la normalización plegada
+    (``fold_input_normalization``).
+    """
+
+    def __init__(self, resize=256, crop=224, mean=MEAN, std=STD, memory_format=torch.contiguous_format,
+                 dtype=torch.float32):
+        self.resize = resize
+        self.crop = crop
+        self.memory_format = memory_format
+        self.dtype = dtype
+        self._lut = normalization_lut(mean, std) if dtype == torch.float32 else None
+        self._local = threading.local()
+
+    @classmethod
+    def for_transform(cls, t, memory_format=torch.contiguous_format):
+        """``Preprocessor`` equivalente a la transformación ``t``, o ``None`` si no sabe reproducirla."""
+        parsed = parse_transform(t)
+        if parsed is None:
+            return None
+        resize, crop, dtype, mean, std = parsed
+        return cls(resize, crop, mean, std, memory_format, dtype)
+
+    def buffer(self, batch_size):
+        """Vista ``(batch_size, 3, crop, crop)`` del buffer de este hilo (sin inicializar)."""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) < batch_size:
+            # Crece hasta el lote más grande visto y se conserva
+            buffer = torch.empty(batch_size, 3, self.crop, self.crop, dtype=self.dtype).contiguous(
+                memory_format=self.memory_format)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+
+    def center_crop(self, image):
+        """Resize y recorte central como los de torchvision, como vista HWC uint8 (sin copiar el recorte)."""
+        resized = F.resize(image, self.resize)
+        width, height = resized.size
+        top = int(round((height - self.crop) / 2.0))
+        left = int(round((width - self.crop) / 2.0))
+        return np.asarray(resized)[top:top + self.crop, left:left + self.crop]
+
+    def fill(self, slot, image):
+        """Escribe ``image`` normalizada en ``slot`` (tensor ``(3, crop, crop)`` del buffer)."""
+        pixels = self.center_crop(image)
+        out = slot.permute(1, 2, 0).numpy()  # vista HWC del buffer, sin copia
+        if self._lut is None:
+            np.copyto(out, pixels)
+            return
+        for c in range(3):
+            np.take(self._lut[c], pixels[..., c], out=out[..., c], mode='clip')
+
+    def __call__(self, images):
+        batch = self.buffer(len(images))
+        for slot, image in zip(batch, images):
+            self.fill(slot, image)
+        return batch
+
+
+def main():
+    from PIL import Image
+    from motor_inferencia import INPUT_TRANSFORMS, iter_image_paths, to_rgb, transform
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fotos', default='fotos_campo')
+    parser.add_argument('--lote', type=int, default=8)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    images = [to_rgb(p) for p in itertools.islice(iter_image_paths(args.fotos), args.lote)]
+    if not images:
+        print(f"No hay fotos en {args.fotos}; se usan imágenes sintéticas de 1280x960")
+        images = [Image.effect_noise((1280, 960), 64 + i).convert('RGB') for i in range(args.lote)]
+
+    for input_format, t in INPUT_TRANSFORMS.items():
+        expected = torch.stack([t(img) for img in images])
+        same = torch.equal(Preprocessor.for_transform(t, torch.channels_last)(images), expected)
+        print(f"Idéntico a la transformación de la entrada {input_format}: {same}")
+
+    preprocessor = Preprocessor.for_transform(transform, torch.channels_last)
+
+    def median_ms(fn):
+        times = []
+        for _ in range(args.repeticiones):
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000)
+        return sorted(times)[len(times) // 2]
+
+    # Lo que hace InferenceEngine.preprocess con transform: apilar y pasar a channels_last
+    before = median_ms(lambda: torch.stack([transform(img) for img in images])
+                       .contiguous(memory_format=torch.channels_last))
+    after = median_ms(lambda: preprocessor(images))
+    print(f"Lote de {len(images)}: transform {before:.2f} ms, Preprocessor {after:.2f} ms")
+    frame = len(images) * 3 * 224 * 224 * 4
+    # ToTensor (float y división), Normalize (copia), stack y channels_last: al menos 5 copias float del lote
+    print(f"Memoria float por lote que transform asigna y libera en cada llamada: "
+          f">= {5 * frame / 2**20:.1f} MiB; Preprocessor: 0 (buffer de {frame / 2**20:.1f} MiB reutilizado)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Descripción y recomendaciones de manejo para cada etapa fenológica del frijol.
+
+Lo usan la interfaz de campo y el servidor de inferencia; antes estaba
+copiado dentro de campo_prueba2_googlenet.py.
+"""
+
+class_recomendaciones = {
+    'V1': {
+        "descripcion": "Emergencia del primer par de hojas unifoliadas completamente abiertas.",
+        "recomendaciones": (
+            "Riego: Mantener humedad uniforme en el perfil de suelo para favorecer desarrollo radicular. "
+            "Control de malezas: Paso temprano de escarda o herbicida residual selectivo. "
+            "Salud de suelo: Revisar pH y enmendar con cal si sea necesario."
+        )
+    },
+    'V2': {
+        "descripcion": "Aparición del primer par de hojas trifoliadas completamente desarrolladas.",
+        "recomendaciones": (
+            "Fertilización: Primera dosis de nitrógeno (si no hay buena inoculación bacteriana), monitorear fósforo y potasio. "
+            "Monitoreo de plagas: Inspeccionar áfidos y trips; usar trampas cromáticas. "
+            "Control de malezas tardías: Segundo pase de escarda o herbicida residual."
+        )
+    },
+    'V3': {
+        "descripcion": "Desarrollo del segundo par de hojas trifoliadas.",
+        "recomendaciones": (
+            "Micronutrientes: Aplicación foliar ligera de zinc y boro si hay clorosis o necrosis. "
+            "Salud foliar: Revisar síntomas de roya y manchas; fungicida preventivo si aparecen. "
+            "Riego: Ajustar frecuencia según humedad del suelo para evitar estrés hídrico."
+        )
+    },
+    'V4': {
+        "descripcion": "Desarrollo del tercer par de hojas trifoliadas; la planta continúa acumulando biomasa.",
+        "recomendaciones": (
+            "Dosel y densidad: Evaluar cobertura del suelo y considerar ajustes de densidad para el próximo ciclo. "
+            "Control biológico: Fomentar insectos benéficos con bandas florales o refugios. "
+            "Nutrición: Refuerzo de potasio para mejorar resistencia al estrés."
+        )
+    },
+    'R5': {
+        "descripcion": "Inicio de la floración; se observan las primeras flores abiertas.",
+        "recomendaciones": (
+            "Riego crítico: Humedad constante durante floración para evitar caída de flores. "
+            "Fungicidas: Aplicar mezcla de contacto + sistémico al inicio de floración. "
+            "Insecticidas: Monitorear y controlar chinches de soya y mosquita blanca."
+        )
+    },
+    'R6': {
+        "descripcion": "Floración plena; la mayoría de las plantas tienen flores.",
+        "recomendaciones": (
+            "Monitoreo climático: Refuerzo de fungicida en periodos lluviosos y riego de auxilio en calor extremo. "
+            "Foliar: Aporte de calcio y magnesio para mejorar cuajado de vainas. "
+            "Control integrado: Mantener trampas y seguimiento de plagas."
+        )
+    },
+    'R7': {
+        "descripcion": "Formación de vainas; las primeras vainas jóvenes son visibles.",
+        "recomendaciones": (
+            "Fertilización de fondo: Si el análisis de tejido lo indica, aplicar fertilizante de liberación lenta. "
+            "Riego de socorro: Mantener 60–70 % de capacidad de campo para proteger número de semillas. "
+            "Inspección de frutos: Vigilar daños por trips y chinches."
+        )
+    },
+    'R8': {
+        "descripcion": "Llenado de vainas; las semillas dentro de las vainas comienzan a desarrollarse.",
+        "recomendaciones": (
+            "Riego óptimo: Evitar déficit hídrico, etapa crítica para rendimiento. "
+            "Enfermedades de vainas: Revisar antracnosis y aplicar fungicida si hay manchas. "
+            "Nutrición final: Aporte foliar de potasio para mejorar transporte de fotosintatos."
+        )
+    },
+    'R9': {
+        "descripcion": "Madurez fisiológica; las semillas alcanzan su tamaño y peso máximo, y las vainas comienzan a secarse.",
+        "recomendaciones": (
+            "Reducción de riego: Suspender cuando las vainas empiecen a secar para facilitar madurez. "
+            "Cosecha: Vigilar humedad de grano (18–20 %) para programar fecha óptima. "
+            "Prevención de pérdidas: Controlar roedores y aves durante madurez."
+        )
+    }
+}
@@ -0,0 +1,123 @@
+"""Registro de modelos por nombre y cambio del modelo activo sin reiniciar la app.
+
+Cada ``ModelSpec`` reúne todo lo que antes estaba fijo en cada script:
+arquitectura, lista de clases, transformación y checkpoint. ``ModelSwitcher``
+mantiene el motor activo y, al pedir otro modelo, lo carga y precalienta en un
+hilo aparte; el anterior sigue clasificando hasta que el nuevo está listo, y
+solo entonces se reemplaza.
+
+Para agregar una cabeza nueva basta con registrar otro ``ModelSpec``; los
+menús solo habilitan los modelos cuyo checkpoint existe (``available``).
+``CascadeSpec`` registra la combinación de un modelo rápido y uno preciso
+(ver ``cascada.py``) como si fuera un modelo más.
+"""
+import os
+import threading
+from cascada import CascadeEngine
+from motor_inferencia import (CHECKPOINT, build_mobilenet_v3, build_model, build_resnet34, class_names,
+                              create_engine, transform)
+
+
+class ModelSpec:
+    """Descripción de un modelo registrado."""
+
+    def __init__(self, name, build, class_names, checkpoint, transform=transform):
+        self.name = name
+        self.build = build
+        self.class_names = class_names
+        self.checkpoint = checkpoint
+        self.transform = transform
+
+    def available(self):
+        """``True`` si el checkpoint está en disco y el modelo se puede cargar."""
+        return os.path.exists(self.checkpoint)
+
+    def create_engine(self):
+        return create_engine(self.checkpoint, self.build, self.class_names, self.transform, name=self.name)
+
+
+class CascadeSpec(ModelSpec):
+    """Modelo en cascada: ``fast`` primero y ``accurate`` cuando la confianza no alcanza el umbral."""
+
+    def __init__(self, name, fast, accurate):
+        super().__init__(name, build=None, class_names=REGISTRY[accurate].class_names, checkpoint=None)
+        self.fast = fast
+        self.accurate = accurate
+
+    def available(self):
+        return REGISTRY[self.fast].available() and REGISTRY[self.accurate].available()
+
+    def create_engine(self):
+        return CascadeEngine(REGISTRY[self.fast].create_engine(), REGISTRY[self.accurate].create_engine(),
+                             name=self.name)
+
+
+REGISTRY = {}
+
+
+def register(spec):
+    REGISTRY[spec.name] = spec
+    return spec
+
+
+register(ModelSpec('G19', build_model, class_names, CHECKPOINT))
+# R23 se entrenó con las mismas 9 carpetas de etapas (mismo orden alfabético que G19)
+register(ModelSpec('R23', build_resnet34, class_names, 'R23.pth'))
+# Clasificador rápido para la cascada, entrenado con las mismas 9 clases
+register(ModelSpec('MV3', build_mobilenet_v3, class_names, 'MV3.pth'))
+register(CascadeSpec('MV3>G19', fast='MV3', accurate='G19'))
+
+
+class ModelSwitcher:
+    """Mantiene el motor activo y permite cambiarlo en caliente."""
+
+    def __init__(self, name):
+        self.engine = load_engine(name)
+        self._swap_lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.engine.name
+
+    def classify_image(self, path_or_pil_image):
+        # Se toma una referencia local: un cambio concurrente no afecta a esta clasificación
+        engine = self.engine
+        return engine.classify_image(path_or_pil_image)
+
+    def classify_batch(self, images, k=1):
+        engine = self.engine
+        return engine.classify_batch(images, k)
+
+    def swap(self, name, on_done=None):
+        """Carga ``name`` en segundo plano y lo activa cuando termina el warm-up.
+
+        ``on_done(name, error)`` se llama desde el hilo de carga; ``error`` es
+        ``None`` si el cambio se completó. Devuelve ``False`` si ya había un
+        cambio en curso.
+        """
+        if not self._swap_lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._swap, args=(name, on_done), name='ModelSwap', daemon=True).start()
+        return True
+
+    def _swap(self, name, on_done):
+        error = None
+        try:
+            engine = load_engine(name)
+            # Asignar la referencia es atómico; el motor anterior se libera cuando nadie lo usa
+            self.engine = engine
+        except Exception as e:
+            error = e
+        finally:
+            self._swap_lock.release()
+        if on_done:
+            on_done(name, error)
+
+
+def load_engine(name):
+    """Crea y precalienta el motor del modelo registrado como ``name``."""
+    if name not in REGISTRY:
+        raise KeyError(f"Modelo no registrado: {name} (disponibles: {', '.join(REGISTRY)})")
+    engine = REGISTRY[name].create_engine()
+    engine.warmup()
+    return engine
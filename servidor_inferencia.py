@@ -0,0 +1,234 @@
+"""Servidor HTTP de inferencia para que varios kioscos y teléfonos compartan un mismo equipo.
+
+Uso:
+    python servidor_inferencia.py [--host 0.0.0.0] [--puerto 8000 | --unix /tmp/frijol.sock]
+                                  [--modelo G19] [--max-lote 8] [--max-espera-ms 20]
+                                  [--backend ...] [--precision ...]
+    python servidor_inferencia.py --cliente http://127.0.0.1:8000 foto1.jpg foto2.jpg ...
+
+Rutas:
+    POST /clasificar[?top=3]  cuerpo: los bytes de la foto (JPEG o PNG)
+    GET  /salud               modelo activo y estadísticas de los lotes
+
+La respuesta de /clasificar es JSON con ``etapa``, ``confianza``,
+``descripcion`` y ``recomendaciones`` (de ``recomendaciones.py``), las
+``top`` clases más probables y el tamaño del lote en el que se clasificó.
+
+Cada petición se decodifica en su propio hilo (los JPEG directamente a la
+escala que usa el modelo si el motor tiene ``scaled_decode``), junto con el
+SHA-256 de sus bytes para la caché de resultados; ``MicroBatcher``
+junta las que llegan casi a la vez en un solo forward de hasta ``--max-lote``
+imágenes, esperando como mucho ``--max-espera-ms`` desde la primera. Con
+``--cliente`` se envían las fotos dadas en paralelo a un servidor, lo que
+permite probar todo en localhost, por ejemplo::
+
+    python servidor_inferencia.py --puerto 8000 &
+    python servidor_inferencia.py --cliente http://127.0.0.1:8000 fotos_campo/*.jpg
+    curl --data-binary @foto.jpg http://127.0.0.1:8000/clasificar
+"""
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from recomendaciones import class_recomendaciones
+
+MAX_BODY_BYTES = 20 * 2**20
+
+
+class MicroBatcher:
+    """Agrupa las imágenes que llegan de varios hilos en lotes para ``engine.classify_batch``."""
+
+    def __init__(self, engine, max_batch=8, max_wait=0.02):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.images = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='MicroBatcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, image, k=1):
+        """Encola ``image`` (``HashedImage``) y devuelve un Future con ``(etiquetas, probs, lote)``."""
+        future = Future()
+        self._queue.put((image, k, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            k = max(item[1] for item in batch)
+            try:
+                labels, probs = self.engine.classify_batch([image for image, _, _ in batch], k)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images += len(batch)
+            for (_, item_k, future), row_labels, row_probs in zip(batch, labels, probs.tolist()):
+                future.set_result((row_labels[:item_k], row_probs[:item_k], len(batch)))
+
+
+def make_handler(batcher):
+    from motor_inferencia import open_bytes  # no en el módulo: --cliente no necesita torch
+
+    class Handler(BaseHTTPRequestHandler):
+        def address_string(self):
+            # Con un socket Unix client_address es una cadena vacía
+            return self.client_address[0] if self.client_address else 'unix'
+
+        def send_json(self, status, data):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlparse(self.path).path != '/salud':
+                return self.send_json(404, {'error': 'ruta no encontrada'})
+            self.send_json(200, {
+                'modelo': batcher.engine.name,
+                'lotes': batcher.batches,
+                'imagenes': batcher.images,
+                'imagenes_por_lote': round(batcher.images / batcher.batches, 2) if batcher.batches else 0.0,
+            })
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/clasificar':
+                return self.send_json(404, {'error': 'ruta no encontrada'})
+            length = int(self.headers.get('Content-Length') or 0)
+            if not 0 < length <= MAX_BODY_BYTES:
+                return self.send_json(400, {'error': 'el cuerpo debe ser una imagen de hasta 20 MiB'})
+            top = parse_qs(url.query).get('top', ['1'])[0]
+            try:
+                k = int(top)
+            except ValueError:
+                k = 0
+            if k < 1:
+                return self.send_json(400, {'error': f'top debe ser un entero positivo, no {top!r}'})
+            k = min(k, len(batcher.engine.class_names))
+            try:
+                # Reducida al decodificar (draft), como las rutas que decodifica el motor
+                image = open_bytes(self.rfile.read(length), batcher.engine.scaled_decode)
+            except Exception as e:
+                return self.send_json(400, {'error': f'imagen no válida: {e}'})
+            start = time.perf_counter()
+            try:
+                labels, probs, batch_size = batcher.submit(image, k).result()
+            except Exception as e:
+                return self.send_json(500, {'error': f'error al clasificar: {e}'})
+            datos = class_recomendaciones.get(labels[0], {})
+            self.send_json(200, {
+                'etapa': labels[0],
+                'confianza': round(probs[0], 4),
+                'descripcion': datos.get('descripcion', 'Sin descripción.'),
+                'recomendaciones': datos.get('recomendaciones', 'Sin recomendaciones.'),
+                'top': [{'etapa': l, 'probabilidad': round(p, 4)} for l, p in zip(labels, probs)],
+                'modelo': batcher.engine.name,
+                'lote': batch_size,
+                'ms': round((time.perf_counter() - start) * 1000, 1),
+            })
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(engine, host='127.0.0.1', port=8000, unix_socket=None, max_batch=8, max_wait=0.02):
+    """Atiende peticiones hasta Ctrl+C."""
+    handler = make_handler(MicroBatcher(engine, max_batch, max_wait))
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, handler)
+        where = unix_socket
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        where = f"http://{host}:{server.server_address[1]}"
+    print(f"Sirviendo {engine.name} en {where} (lote máx. {max_batch}, espera máx. {max_wait * 1000:.0f} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+def classify_remote(url, path, top=1):
+    """Envía la foto ``path`` a ``url``/clasificar y devuelve la respuesta JSON."""
+    with open(path, 'rb') as f:
+        request = urllib.request.Request(f"{url.rstrip('/')}/clasificar?top={top}", data=f.read(),
+                                         headers={'Content-Type': 'application/octet-stream'})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def run_client(url, paths, top):
+    """Envía todas las fotos a la vez (para ejercitar los micro-lotes) e imprime las respuestas."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, len(paths))) as pool:
+        for path, result in zip(paths, pool.map(lambda p: classify_remote(url, p, top), paths)):
+            print(f"{path}: {result['etapa']} ({result['confianza']:.1%}), lote de {result['lote']}, "
+                  f"{result['ms']:.0f} ms en el servidor")
+    print(f"{len(paths)} fotos en {time.perf_counter() - start:.2f} s")
+    with urllib.request.urlopen(f"{url.rstrip('/')}/salud") as response:
+        print(json.load(response))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help="0.0.0.0 para aceptar equipos de la red local")
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--unix', default=None, help="ruta de un socket Unix en lugar de TCP")
+    parser.add_argument('--modelo', default='G19')
+    parser.add_argument('--max-lote', type=int, default=8)
+    parser.add_argument('--max-espera-ms', type=float, default=20)
+    parser.add_argument('--cliente', default=None, metavar='URL', help="enviar fotos a un servidor en URL")
+    parser.add_argument('--top', type=int, default=1)
+    parser.add_argument('fotos', nargs='*')
+    args, _ = parser.parse_known_args()
+
+    if args.cliente:
+        if not args.fotos:
+            raise SystemExit("Indique las fotos a enviar")
+        return run_client(args.cliente, args.fotos, args.top)
+
+    import motor_inferencia
+    from registro_modelos import load_engine
+    # Varios kioscos pueden enviar la misma foto (--cache-resultados 0 desactiva la caché)
+    motor_inferencia.config['result_cache_size'] = motor_inferencia.DEFAULT_RESULT_CACHE_SIZE
+    motor_inferencia.configure_from_args()  # --backend, --precision, --hilos, ...
+    engine = load_engine(args.modelo)
+    serve(engine, args.host, args.puerto, args.unix, args.max_lote, args.max_espera_ms / 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Pruebas de las piezas con lógica propia: caché de resultados, flujo MJPEG, micro-lotes,
+preprocesamiento, normalización plegada y estadísticas de la cascada.
+
+Uso:
+    python -m pytest -q test_componentes.py
+
+No necesitan checkpoints, cámara ni pantalla: los modelos son capas sueltas
+con pesos aleatorios y las fotos, imágenes sintéticas.
+"""
+import io
+import threading
+import pytest
+import torch
+import torch.nn as nn
+from PIL import Image
+from camara_continua import split_jpeg_stream
+from cascada import CascadeStats
+from motor_inferencia import INPUT_TRANSFORMS, HashedImage, InferenceEngine, ResultCache
+from optimizar_modelo import NormalizedInputConv
+from preprocesamiento import MEAN, STD, Preprocessor
+from servidor_inferencia import MicroBatcher
+
+
+def noise_image(width, height, sigma=64):
+    """Imagen RGB de ruido gaussiano (distinta en cada llamada)."""
+    return Image.effect_noise((width, height), sigma).convert('RGB')
+
+
+def jpeg_bytes(width=64, height=48):
+    buffer = io.BytesIO()
+    noise_image(width, height).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+# --- ResultCache ---
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(2)
+    cache.put('a', [1.0])
+    cache.put('b', [2.0])
+    assert cache.get('a') == [1.0]  # 'a' pasa a ser la más reciente
+    cache.put('c', [3.0])
+    assert cache.get('b') is None
+    assert cache.get('a') == [1.0] and cache.get('c') == [3.0]
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_result_cache_persists_and_trims_to_max_entries(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    cache = ResultCache(3, path)
+    for i, key in enumerate('abc'):
+        cache.put(key, [float(i)])
+    cache.save()
+
+    reopened = ResultCache(3, path)
+    assert [reopened.get(k) for k in 'abc'] == [[0.0], [1.0], [2.0]]
+    # Con menos entradas se conservan las más recientes
+    smaller = ResultCache(2, path)
+    assert smaller.get('a') is None and smaller.get('c') == [2.0]
+
+
+@pytest.fixture
+def engine():
+    return InferenceEngine(nn.Identity(), model_id='G19:G19.pth:abc', result_cache=ResultCache(8))
+
+
+def test_cache_keys_follow_content_not_object(engine):
+    a = noise_image(32, 32)
+    b = a.copy()
+    other = noise_image(32, 32)
+    key_a, key_b, key_other = engine.cache_keys([a, b, other])
+    assert key_a == key_b
+    assert key_a != key_other
+    data = jpeg_bytes()
+    hashed = HashedImage(Image.open(io.BytesIO(data)), 'f' * 64)
+    assert engine.cache_keys([hashed])[0].startswith('f' * 64 + ':')
+
+
+def test_cache_keys_change_with_model_and_setup(engine):
+    image = noise_image(32, 32)
+    key = engine.cache_keys([image])[0]
+    engine.model_id = 'G19:G19_int8.ts:def'
+    assert engine.cache_keys([image])[0] != key
+    engine.model_id = 'G19:G19.pth:abc'
+    engine.input_format = 'uint8'
+    assert engine.cache_keys([image])[0] != key
+
+
+def test_cache_keys_skip_tensors_and_engines_without_cache(engine):
+    assert engine.cache_keys([torch.zeros(3, 224, 224)]) == [None]
+    engine.result_cache = None
+    assert engine.cache_keys([noise_image(32, 32)]) == [None]
+
+
+# --- split_jpeg_stream ---
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1 << 16])
+def test_split_jpeg_stream_at_any_chunk_boundary(chunk_size):
+    frames = [jpeg_bytes() for _ in range(3)]
+    # Basura antes del primer SOI y entre fotogramas, como al engancharse a mitad de un flujo
+    stream = io.BytesIO(b'\x00\xd9basura' + frames[0] + b'\xff' + frames[1] + frames[2])
+    assert list(split_jpeg_stream(stream, chunk_size)) == frames
+
+
+def test_split_jpeg_stream_drops_incomplete_last_frame():
+    frame = jpeg_bytes()
+    stream = io.BytesIO(frame + frame[:len(frame) // 2])
+    assert list(split_jpeg_stream(stream, 5)) == [frame]
+
+
+# --- MicroBatcher ---
+
+class FakeEngine:
+    """Motor que anota el tamaño de cada lote; el primer lote espera a ``release``."""
+
+    class_names = ['R5', 'R6', 'V1']
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.sizes = []
+
+    def classify_batch(self, images, k):
+        self.started.set()
+        self.release.wait(5)
+        self.sizes.append(len(images))
+        if any(image == 'rota' for image in images):
+            raise ValueError('imagen rota')
+        probs = torch.tensor([[0.7, 0.2, 0.1]] * len(images))
+        return [self.class_names[:k]] * len(images), probs[:, :k]
+
+
+def test_micro_batcher_groups_queued_images_up_to_max_batch():
+    engine = FakeEngine()
+    batcher = MicroBatcher(engine, max_batch=4, max_wait=0.05)
+    first = batcher.submit('foto0')
+    assert engine.started.wait(5)
+    # Mientras el primer lote se clasifica llegan cinco más: salen en lotes de 4 y 1
+    rest = [batcher.submit(f'foto{i}', k=1 + i % 3) for i in range(1, 6)]
+    engine.release.set()
+    results = [f.result(5) for f in [first, *rest]]
+    assert engine.sizes == [1, 4, 1]
+    assert [r[2] for r in results] == [1, 4, 4, 4, 4, 1]
+    assert (batcher.batches, batcher.images) == (3, 6)
+
+
+def test_micro_batcher_trims_each_result_to_its_k():
+    engine = FakeEngine()
+    engine.release.set()
+    batcher = MicroBatcher(engine, max_batch=8, max_wait=0.05)
+    labels, probs, _ = batcher.submit('foto', k=2).result(5)
+    assert labels == ['R5', 'R6']
+    assert probs == pytest.approx([0.7, 0.2])
+
+
+def test_micro_batcher_reports_engine_errors_and_keeps_serving():
+    engine = FakeEngine()
+    engine.release.set()
+    batcher = MicroBatcher(engine, max_batch=8, max_wait=0.05)
+    with pytest.raises(ValueError):
+        batcher.submit('rota').result(5)
+    assert batcher.submit('foto').result(5)[0] == ['R5']
+
+
+# --- Preprocessor ---
+
+@pytest.mark.parametrize('input_format', list(INPUT_TRANSFORMS))
+@pytest.mark.parametrize('size', [(1280, 960), (301, 257), (257, 400)])
+def test_preprocessor_matches_torchvision_bit_for_bit(input_format, size):
+    t = INPUT_TRANSFORMS[input_format]
+    images = [noise_image(*size, sigma) for sigma in (32, 96)]
+    expected = torch.stack([t(img) for img in images])
+    for memory_format in (torch.contiguous_format, torch.channels_last):
+        preprocessor = Preprocessor.for_transform(t, memory_format)
+        assert preprocessor is not None
+        assert torch.equal(preprocessor(images), expected)
+
+
+# --- NormalizedInputConv ---
+
+@pytest.mark.parametrize('conv', [
+    nn.Conv2d(3, 8, 7, stride=2, padding=3),  # como conv1 de GoogLeNet y ResNet
+    nn.Conv2d(3, 8, 3, stride=1, padding=1, bias=False),
+])
+def test_normalized_input_conv_matches_normalize_then_conv(conv):
+    torch.manual_seed(0)
+    size = (32, 40)
+    pixels = torch.randint(0, 256, (2, 3, *size), dtype=torch.uint8)
+    mean = torch.tensor(MEAN)[None, :, None, None]
+    std = torch.tensor(STD)[None, :, None, None]
+    with torch.no_grad():
+        expected = conv((pixels.float() / 255 - mean) / std)
+        folded_uint8 = NormalizedInputConv(conv, MEAN, STD, input_scale=255.0, input_size=size)(pixels)
+        folded_float = NormalizedInputConv(conv, MEAN, STD, input_scale=1.0, input_size=size)(pixels.float() / 255)
+    torch.testing.assert_close(folded_uint8, expected, atol=1e-4, rtol=1e-4)
+    torch.testing.assert_close(folded_float, expected, atol=1e-4, rtol=1e-4)
+
+
+# --- CascadeStats ---
+
+def test_fallback_rate_at_uses_confidence_histogram():
+    stats = CascadeStats()
+    assert stats.fallback_rate_at(0.5) == 0.0
+    confidences = torch.tensor([0.1, 0.3, 0.55, 0.9])
+    stats.record(confidences, confidences < 0.5, agreements=1)
+    assert stats.fallback_rate == 0.5
+    assert stats.fallback_rate_at(0.0) == 0.0
+    assert stats.fallback_rate_at(0.5) == 0.5
+    assert stats.fallback_rate_at(0.6) == 0.75
+    assert stats.fallback_rate_at(1.0) == 1.0
+    stats.reset()
+    assert stats.total == 0 and stats.fallback_rate_at(1.0) == 0.0
@@ -0,0 +1,304 @@
+"""Captura y clasificación en un hilo de fondo para las interfaces Tkinter.
+
+``tomar_y_clasificar`` ejecutaba libcamera-jpeg, la decodificación, el forward
+de GoogLeNet y el thumbnail LANCZOS en el hilo de Tk, congelando la ventana.
+``CaptureWorker`` hace ese trabajo en un hilo aparte y publica eventos en una
+cola que la interfaz drena con ``root.after``; las capturas se encolan, así
+que se puede pedir una segunda foto mientras la primera se clasifica.
+
+Arranque escalonado: importar torch y cargar y precalentar el modelo tarda
+varios segundos en la Raspberry Pi, y si se hace al importar el script la
+ventana no aparece hasta que termina. Por eso las interfaces no importan
+``motor_inferencia`` arriba: lo hace la función ``load_classifier``, que
+corre en otro hilo con la ventana ya visible. ``CaptureWorker`` la ejecuta
+antes que nada en su hilo, y el botón de captura se habilita al recibir el
+evento 'listo'. Las interfaces anteriores, que todavía capturan y clasifican
+en el hilo de Tk, hacen lo mismo con ``staged_boot``.
+
+Tk no es seguro entre hilos: el trabajador solo produce imágenes PIL y el
+``ImageTk.PhotoImage`` se crea siempre en el hilo de la interfaz.
+
+La foto no pasa por la tarjeta SD: ``capturar_jpeg_bytes`` lee el JPEG de la
+salida estándar de libcamera-jpeg (``-o -``) y se clasifica desde memoria.
+Solo si la política de conservación (``retention``) lo pide, ``PhotoWriter``
+la escribe en ``save_dir`` desde otro hilo, sin demorar el resultado. Las
+interfaces la toman de ``--conservar never|always`` (``retention_from_args``).
+"""
+import argparse
+import io
+import itertools
+import os
+import queue
+import atexit
+import subprocess
+import threading
+from datetime import datetime
+from PIL import Image
+from decodificacion import CaptureFrame
+
+
+# 'never': las fotos solo existen en memoria; 'always': cada captura se guarda en save_dir
+RETENTION_POLICIES = ('never', 'always')
+
+
+def retention_from_args(default, argv=None):
+    """Lee ``--conservar never|always`` (ignora el resto); sin la opción devuelve ``default``."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--conservar', choices=RETENTION_POLICIES, default=default)
+    args, _ = parser.parse_known_args(argv)
+    return args.conservar
+
+
+def capturar_jpeg_bytes(width=1280, height=960):
+    """Toma una foto con libcamera-jpeg y devuelve los bytes del JPEG (leídos de su salida estándar)."""
+    result = subprocess.run(
+        ['libcamera-jpeg', '-n', '-o', '-', '-t', '200', '--width', str(width), '--height', str(height)],
+        check=True, stdout=subprocess.PIPE
+    )
+    if not result.stdout:
+        raise RuntimeError("libcamera-jpeg no devolvió ninguna imagen")
+    return result.stdout
+
+
+class FakeCamera:
+    """Cámara simulada para medir sin libcamera: cada captura entrega la siguiente foto de ``folder``.
+
+    ``read`` reemplaza a ``capturar_jpeg_bytes``; llamada con una ruta guarda
+    la foto en ese archivo, como ``libcamera-jpeg -o ruta``. Recorre las fotos en ciclo;
+    si no hay ninguna, entrega siempre una imagen sintética del tamaño pedido.
+    Las fotos que no se pueden decodificar se informan al abrir la cámara, se
+    omiten y quedan en ``skipped``.
+    """
+
+    def __init__(self, folder=None):
+        paths = sorted(os.path.join(d, f) for d, _, files in os.walk(folder or '') for f in files
+                       if f.lower().endswith(('.jpg', '.jpeg')))
+        self.skipped = [p for p in paths if not self._decodes(p)]
+        paths = [p for p in paths if p not in self.skipped]
+        self._paths = itertools.cycle(paths) if paths else None
+        self._synthetic = {}
+
+    @staticmethod
+    def _decodes(path):
+        """``True`` si ``path`` es un JPEG completo (se decodifica reducido, solo para comprobarlo)."""
+        try:
+            with Image.open(path) as img:
+                img.draft('RGB', (img.width // 8, img.height // 8))
+                img.load()
+            return True
+        except (OSError, ValueError) as e:  # archivo truncado o que no es una imagen
+            print(f"No se pudo leer {path}, se omite: {e}")
+            return False
+
+    def read(self, width=1280, height=960):
+        if self._paths is not None:
+            with open(next(self._paths), 'rb') as f:
+                return f.read()
+        if (width, height) not in self._synthetic:
+            buffer = io.BytesIO()
+            Image.effect_noise((width, height), 64).convert('RGB').save(buffer, 'JPEG', quality=90)
+            self._synthetic[width, height] = buffer.getvalue()
+        return self._synthetic[width, height]
+
+    def __call__(self, ruta, width=1280, height=960):
+        data = self.read(width, height)
+        with open(ruta, 'wb') as f:
+            f.write(data)
+
+
+class PhotoWriter:
+    """Escribe fotos en disco desde un hilo propio, en orden de llegada.
+
+    Cada foto se escribe en un temporal y se renombra, así que nunca queda un
+    JPEG a medias con el nombre final. Al salir del programa se terminan de
+    escribir las pendientes.
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='PhotoWriter', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def save(self, ruta, data):
+        self.jobs.put((ruta, data))
+
+    def flush(self):
+        """Espera a que se escriban las fotos encoladas."""
+        self.jobs.join()
+
+    def _run(self):
+        while True:
+            ruta, data = self.jobs.get()
+            try:
+                os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+                tmp = ruta + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, ruta)
+            except OSError as e:
+                print(f"No se pudo guardar {ruta}: {e}")
+            finally:
+                self.jobs.task_done()
+
+
+def load_default_classifier():
+    """``load_classifier`` del motor por defecto (G19): lo carga, hace el warm-up y devuelve su ``classify_image``."""
+    from motor_inferencia import get_engine
+    engine = get_engine()
+    engine.warmup()
+    return engine.classify_image
+
+
+class StagedClassifier:
+    """Clasificador que se carga en segundo plano; se llama como la función que devuelve ``load_classifier``."""
+
+    def __init__(self):
+        self.classify = None
+
+    def __call__(self, *args, **kwargs):
+        if self.classify is None:
+            raise RuntimeError("El modelo todavía se está cargando")
+        return self.classify(*args, **kwargs)
+
+
+def staged_boot(root, load_classifier, status_label, capture_btn, ready_text='Esperando acción...',
+                interval_ms=50):
+    """Arranque escalonado de una interfaz que captura en el hilo de Tk (sin ``CaptureWorker``).
+
+    Ejecuta ``load_classifier`` en un hilo aparte. Mientras tanto
+    ``capture_btn`` está deshabilitado y ``status_label`` muestra la carga;
+    al terminar muestra ``ready_text`` y habilita el botón, o muestra el
+    error. Devuelve un ``StagedClassifier`` que el script usa como su
+    función de clasificación.
+    """
+    classifier = StagedClassifier()
+    result = queue.Queue(maxsize=1)
+
+    def run():
+        try:
+            result.put((load_classifier(), None))
+        except Exception as e:
+            result.put((None, e))
+
+    def poll():
+        try:
+            classify, error = result.get_nowait()
+        except queue.Empty:
+            root.after(interval_ms, poll)
+            return
+        if error is not None:
+            status_label.config(text=f'Error al cargar el modelo: {error}')
+            return
+        classifier.classify = classify
+        status_label.config(text=ready_text)
+        capture_btn.config(state='normal')
+
+    capture_btn.config(state='disabled')
+    status_label.config(text='Cargando modelo...')
+    threading.Thread(target=run, name='CargaModelo', daemon=True).start()
+    root.after(interval_ms, poll)
+    return classifier
+
+
+class CaptureWorker:
+    """Hilo que procesa capturas en orden y publica eventos en ``events``.
+
+    Cada evento es una tupla ``(tipo, dato)``:
+
+    - ``('estado', texto)``: progreso, ej. 'Clasificando...'.
+    - ``('listo', None)``: modelo cargado y precalentado; ya se puede capturar.
+    - ``('imagen', (ruta, frame, miniatura))``: ``CaptureFrame`` de la foto y
+      su miniatura rotada -90°, lista para mostrarse antes de clasificar;
+      ``frame.preview(tamaño)`` rehace la miniatura si cambia la ventana.
+    - ``('resultado', (ruta, clase))``: clasificación terminada.
+    - ``('error', (etapa, excepcion))``: etapa es 'modelo', 'captura', 'mostrar'
+      o 'clasificar'.
+
+    ``ruta`` es donde se guarda la foto, o ``None`` si la política de
+    conservación no la guarda; con 'always' el archivo puede aparecer un
+    poco después del evento.
+
+    ``load_classifier`` se ejecuta en el hilo del trabajador y debe devolver
+    la función que clasifica una imagen (recibe una imagen PIL en RGB, la
+    misma que se decodificó para la vista previa). ``capture`` devuelve los
+    bytes de un JPEG (``capturar_jpeg_bytes`` o ``FakeCamera(...).read``).
+    """
+
+    def __init__(self, load_classifier, save_dir='fotos', capture=capturar_jpeg_bytes, retention='never'):
+        if retention not in RETENTION_POLICIES:
+            raise ValueError(f"Política de conservación desconocida: {retention}")
+        self.load_classifier = load_classifier
+        self.classify = None
+        self.save_dir = save_dir
+        self.capture = capture
+        self.retention = retention
+        self.writer = PhotoWriter() if retention == 'always' else None
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='CaptureWorker', daemon=True)
+        self._thread.start()
+
+    def submit(self, preview_size):
+        """Encola una captura; ``preview_size`` es el tamaño máximo de la miniatura."""
+        with self._lock:
+            self._pending += 1
+        self.jobs.put(preview_size)
+
+    def pending(self):
+        """Capturas encoladas o en curso cuyo evento final aún no se publicó."""
+        with self._lock:
+            return self._pending
+
+    def poll(self, root, handle_event, interval_ms=50):
+        """Drena la cola de eventos desde el hilo de Tk cada ``interval_ms``."""
+        try:
+            while True:
+                handle_event(*self.events.get_nowait())
+        except queue.Empty:
+            pass
+        root.after(interval_ms, self.poll, root, handle_event, interval_ms)
+
+    def _run(self):
+        self.events.put(('estado', 'Cargando modelo...'))
+        try:
+            self.classify = self.load_classifier()
+        except Exception as e:
+            self.events.put(('error', ('modelo', e)))
+            return
+        self.events.put(('listo', None))
+        while True:
+            preview_size = self.jobs.get()
+            final_event = self._process(preview_size)
+            # Se descuenta antes de publicar para que la interfaz vea pending() actualizado
+            with self._lock:
+                self._pending -= 1
+            self.events.put(final_event)
+
+    def _process(self, preview_size):
+        self.events.put(('estado', 'Capturando imagen...'))
+        try:
+            data = self.capture()
+        except Exception as e:
+            return ('error', ('captura', e))
+        ruta = None
+        if self.writer is not None:
+            ruta = os.path.join(self.save_dir, f'captura_{datetime.now():%Y%m%d_%H%M%S_%f}.jpg')
+            self.writer.save(ruta, data)
+
+        try:
+            # Una sola decodificación, a la escala que necesitan la ventana y el modelo
+            frame = CaptureFrame(io.BytesIO(data), preview_size)
+            thumbnail = frame.preview(preview_size)
+        except Exception as e:
+            return ('error', ('mostrar', e))
+        self.events.put(('imagen', (ruta, frame, thumbnail)))
+
+        self.events.put(('estado', 'Clasificando...'))
+        try:
+            predicted_class_name = self.classify(frame.image)
+        except Exception as e:
+            return ('error', ('clasificar', e))
+        return ('resultado', (ruta, predicted_class_name))